@@ -0,0 +1,139 @@
+"""
+Stand-in for the Telegram Bot API: accepts sendMessage, editMessageText and the other requests the bot makes,
+optionally answering 429 above a global message rate like Telegram does. Counts what it gets per method and chat.
+Updates put in with push() are delivered by getUpdates.
+
+    python bench/fake_telegram.py --port 8767 --flood-limit 30
+    TELEGRAM_API_URL=http://127.0.0.1:8767 python main.py
+"""
+import time
+import asyncio
+import argparse
+import itertools
+from collections import Counter, deque
+from urllib.parse import parse_qsl
+from aiohttp import web
+
+MESSAGE_METHODS = ('sendMessage', 'editMessageText')
+
+
+def ok(result) -> web.Response:
+    return web.json_response({'ok': True, 'result': result})
+
+
+class FakeTelegram:
+    """
+        flood_limit - messages per second for all chats together, 0 - no limit.
+        """
+
+    def __init__(self, flood_limit: float = 0):
+        self.flood_limit = flood_limit
+        self._second = 0  # current second and the messages accepted in it
+        self._sent = 0
+        self.calls = Counter()  # method -> requests
+        self.flooded = 0  # requests answered with 429
+        self.received = Counter()  # chat id -> messages accepted
+        self._waiters = {}  # chat id -> (messages to wait for, future)
+        self._message_ids = itertools.count(1)
+        self._updates = deque()  # updates not confirmed by the offset of getUpdates yet
+        self._new_updates = asyncio.Event()
+        self.app = web.Application()
+        self.app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        self._runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        # the bot sends the parameters form-encoded, as the body of a GET request
+        params = dict(parse_qsl((await request.read()).decode())) or dict(request.query)
+        self.calls[method] += 1
+        if method in MESSAGE_METHODS:
+            return self.message(method, params)
+        if method == 'getMe':
+            return ok({'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'})
+        if method == 'getUpdates':
+            return ok(await self.get_updates(int(params.get('offset', 0)), int(params.get('limit', 100)),
+                                             float(params.get('timeout', 0))))
+        return ok(True)
+
+    def push(self, update: dict):
+        self._updates.append(update)
+        self._new_updates.set()
+
+    async def get_updates(self, offset: int, limit: int, timeout: float) -> list:
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return list(itertools.islice(self._updates, limit))
+
+    def message(self, method: str, params: dict) -> web.Response:
+        if self.flood_limit:
+            second = int(time.monotonic())
+            if second != self._second:
+                self._second, self._sent = second, 0
+            if self._sent >= self.flood_limit:
+                self.flooded += 1
+                return web.json_response({'ok': False, 'error_code': 429, 'parameters': {'retry_after': 1},
+                                          'description': 'Too Many Requests: retry after 1'}, status=429)
+            self._sent += 1
+        chat_id = int(params['chat_id'])
+        self.received[chat_id] += 1
+        waiter = self._waiters.get(chat_id)
+        if waiter is not None and self.received[chat_id] >= waiter[0] and not waiter[1].done():
+            waiter[1].set_result(None)
+        message_id = int(params['message_id']) if method == 'editMessageText' else next(self._message_ids)
+        return ok({'message_id': message_id, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'},
+                   'text': params.get('text', '')})
+
+    async def wait_for(self, chat_id: int, count: int, timeout: float):
+        """
+            Waits until count messages of chat_id have been accepted in total.
+            """
+        if self.received[chat_id] >= count:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = (count, future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        finally:
+            del self._waiters[chat_id]
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8767):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def serve(args):
+    telegram = FakeTelegram(args.flood_limit)
+    await telegram.start(args.host, args.port)
+    print(f"Fake Telegram Bot API on http://{args.host}:{args.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await telegram.stop()
+        print(f"calls: {dict(telegram.calls)}, 429: {telegram.flooded}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8767)
+    parser.add_argument('--flood-limit', type=float, default=0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
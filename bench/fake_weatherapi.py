@@ -0,0 +1,141 @@
+"""
+Stand-in for api.weatherapi.com: current.json, forecast.json, history.json and search.json answered with
+realistic payloads (bench/payloads.py) after a configurable latency, a share of them failing with 503, error 9999
+or 429 with Retry-After.
+Locations starting with "nowhere" are not found (error 1006, nothing in search.json), ids handed out by
+search.json are accepted as q=id:<id>.
+
+    python bench/fake_weatherapi.py --port 8766 --latency 0.08 --error-rate 0.01
+    WEATHER_API_URL=http://127.0.0.1:8766/v1 python main.py
+"""
+import json
+import zlib
+import random
+import asyncio
+import argparse
+from collections import Counter
+from aiohttp import web
+
+import payloads
+
+RETRY_AFTER = 1  # seconds, Retry-After of the injected 429
+
+
+def error(status: int, code: int, message: str) -> web.Response:
+    return web.json_response({'error': {'code': code, 'message': message}}, status=status)
+
+
+class FakeWeatherApi:
+    """
+        latency - median seconds before answering, jitter - sigma of the lognormal spread around it.
+        """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.5, error_rate: float = 0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()  # endpoint -> requests
+        self.errors = Counter()  # injected error -> times
+        self._bodies = {}  # request -> response body, generating a payload costs more than the bot parsing it
+        self._ids = {}  # location id -> the q it was found by
+        self.app = web.Application()
+        self.app.router.add_get('/v1/{endpoint}', self.handle)
+        self._runner = None
+
+    def delay(self) -> float:
+        return self.latency * self.random.lognormvariate(0, self.jitter) if self.latency else 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        endpoint = request.match_info['endpoint'].removesuffix('.json')
+        query = request.query
+        self.calls[endpoint] += 1
+        await asyncio.sleep(self.delay())
+        if not query.get('key'):
+            return error(401, 1002, 'API key is invalid or not provided.')
+        if self.random.random() < self.error_rate:
+            kind = self.random.choice(('503', '9999', '429'))
+            self.errors[kind] += 1
+            if kind == '503':
+                return web.Response(status=503, text='<html><body>Service Unavailable</body></html>',
+                                    content_type='text/html')
+            if kind == '429':
+                return web.Response(status=429, text='Too Many Requests', headers={'Retry-After': str(RETRY_AFTER)})
+            return error(400, 9999, 'Internal application error.')
+        q = query.get('q', '')
+        if not q:
+            return error(400, 1003, "Parameter 'q' not provided.")
+        if endpoint == 'search':
+            return web.json_response(self.search(q))
+        if q.startswith('id:'):
+            q = self._ids.get(q[3:], 'nowhere')
+        if q.lower().startswith('nowhere'):
+            return error(400, 1006, 'No matching location found.')
+        if endpoint not in ('current', 'forecast', 'history') or (endpoint == 'history' and not query.get('dt')):
+            return error(400, 1005, 'API request url is invalid.')
+        key = (endpoint, q, query.get('days'), query.get('dt'), query.get('end_dt'), query.get('hour'))
+        body = self._bodies.get(key)
+        if body is None:
+            body = self._bodies[key] = json.dumps(self.payload(endpoint, q, query)).encode()
+        return web.Response(body=body, content_type='application/json')
+
+    def search(self, q: str) -> list:
+        """
+            One match per location: all the spellings differing in case and spaces find the same id.
+            """
+        q = ' '.join(q.lower().split())
+        if q.startswith('nowhere'):
+            return []
+        location_id = str(zlib.crc32(q.encode()) % 10 ** 7)
+        self._ids[location_id] = q
+        location = payloads.location(q)
+        return [{'id': int(location_id), 'url': q.replace(' ', '-'),
+                 **{field: location[field] for field in ('name', 'region', 'country', 'lat', 'lon')}}]
+
+    @staticmethod
+    def payload(endpoint: str, q: str, query) -> dict:
+        hour_param = query.get('hour')
+        if endpoint == 'history':
+            return payloads.history(q, query['dt'], hour_param, query.get('end_dt'))
+        if endpoint == 'current':
+            return {'location': payloads.location(q), 'current': payloads.current(random.Random(q))}
+        return payloads.forecast(q, min(int(query.get('days', 1)), 14), hour_param)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8766):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def serve(args):
+    api = FakeWeatherApi(args.latency, args.jitter, args.error_rate, args.seed)
+    await api.start(args.host, args.port)
+    print(f"Fake weatherapi.com on http://{args.host}:{args.port}/v1")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await api.stop()
+        print(f"calls: {dict(api.calls)}, injected errors: {dict(api.errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Cost of building the messages the handlers send, per message, from parsed weatherapi.com responses
+(bench/payloads.py): the lookups of wind and condition and every report of rendering.
+
+    python bench/format_bench.py --days 10
+"""
+import os
+import sys
+import timeit
+import argparse
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import payloads
+import rendering
+from models import WeatherData
+
+
+def cases(days: int) -> dict:
+    forecast = WeatherData.model_validate(payloads.forecast('Moskva', days + 1, 12))
+    history = [WeatherData.model_validate(payloads.history('Moskva', str(date.today() - timedelta(days=n)), 12))
+               for n in range(7)]
+    location, current, forecastday = forecast.location, forecast.current, forecast.forecast.forecastday
+    return {
+        'wind': lambda: rendering.wind(current.wind_dir, current.wind_kph, forecastday[0].day.maxwind_kph),
+        'weather_condition': lambda: rendering.weather_condition(forecastday[0].day.condition),
+        'current_report': lambda: rendering.current_report(location, current, forecastday[0]),
+        'date_report': lambda: rendering.date_report(location, current, forecastday[1]),
+        f'forecast_report, {days} days': lambda: rendering.forecast_report(location, current, forecastday[1:]),
+        f'forecast_report table, {days} days': lambda: rendering.forecast_report(location, current, forecastday[1:],
+                                                                                 table=True),
+        'statistic_report, 7 days': lambda: rendering.statistic_report(history),
+        'prediction_report': lambda: rendering.prediction_report(3.4, 1.2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, func in cases(args.days).items():
+        seconds = min(timeit.repeat(func, number=args.number, repeat=5)) / args.number
+        print(f"{name:<36}{seconds * 1e6:>8.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+Drives synthetic chats through the bot handlers against the stand-in weatherapi.com and Telegram servers
+(bench/fake_weatherapi.py, bench/fake_telegram.py), all in one process. Every chat picks a city, then runs
+random commands one after another like a user would. A step's latency is the time from the update reaching
+the bot until all its replies are accepted by the fake Telegram.
+
+Reports throughput, p50/p90/p99 latency per step and the upstream calls. Save a run with --json and pass it
+to --compare after a change to see the difference:
+
+    python bench/load_test.py --chats 2000 --concurrency 200 --json baseline.json
+    python bench/load_test.py --chats 2000 --concurrency 200 --compare baseline.json
+
+With --workers N the bot runs as `python main.py` with WORKERS=N instead, polling the fake Telegram for the
+updates, to see how it scales with the worker processes:
+
+    python bench/load_test.py --workers 1 --json one.json
+    python bench/load_test.py --workers 4 --compare one.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+import importlib
+import itertools
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_weatherapi import FakeWeatherApi
+from fake_telegram import FakeTelegram
+from webhook_load import make_update
+
+# command -> steps: (text sent by the user, step name in the report)
+SCENARIOS = {
+    'current_weather': [('/current_weather', 'current_weather')],
+    'forecast_for_several_days': [('/forecast_for_several_days', 'forecast_for_several_days'),
+                                  ('{days}', 'several_days')],
+    'weather_statistic': [('/weather_statistic', 'weather_statistic')],
+    'prediction': [('/prediction', 'prediction')],
+}
+SET_CITY = [('/change_city', 'change_city'), ('{city}', 'city')]
+
+
+def percentile(values: list, p: float) -> float:
+    """
+        Nearest-rank percentile of sorted values.
+        """
+    return values[max(0, min(len(values) - 1, round(p / 100 * len(values) + 0.5) - 1))]
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure(args):
+    """
+        The bot reads its settings at import, so the environment is prepared before main is imported
+        (or started, with --workers).
+        """
+    os.environ.update(
+        TOKEN='123456:bench', API_KEY='bench',
+        WEATHER_API_URL=f'http://127.0.0.1:{args.api_port}/v1',
+        TELEGRAM_API_URL=f'http://127.0.0.1:{args.telegram_port}',
+        HISTORY_DB=args.history_db or os.path.join(tempfile.mkdtemp(prefix='bench'), 'history.sqlite3'),
+        SESSIONS_SNAPSHOT='', STATUS_PORT='0',
+        WEATHER_API_RATE=str(args.api_rate), WEATHER_API_BURST=str(max(int(args.api_rate), 1)),
+        TELEGRAM_GLOBAL_RATE=str(args.telegram_rate), TELEGRAM_CHAT_INTERVAL=str(args.chat_interval),
+    )
+    if args.workers:
+        os.environ.update(WORKERS=str(args.workers), BOT_MODE='polling', STARTUP_CHECKS='blocking')
+    if args.workers > 1:
+        os.environ['SHARED_CACHE_DB'] = os.path.join(tempfile.mkdtemp(prefix='bench'), 'cache.sqlite3')
+
+
+class LoadTest:
+    """
+        bot_main - the imported main module to drive in this process, None if the bot runs as a separate process
+        and gets the updates from the fake Telegram.
+        """
+
+    def __init__(self, args, telegram: FakeTelegram, bot_main=None):
+        self.args = args
+        self.bot = bot_main and bot_main.bot
+        self.telegram = telegram
+        self.random = random.Random(args.seed)
+        self.cities = [f'city{n}' for n in range(args.cities)]
+        self.city_weights = [1 / (n + 1) for n in range(args.cities)]  # a few big cities, a long tail of small ones
+        self.latencies = defaultdict(list)  # step -> seconds
+        self.timeouts = Counter()  # step -> steps without all the replies in time
+        self.update_ids = itertools.count(1)
+        # replies per chat to wait for after a step: the requests enqueued in this process, otherwise
+        # one per step - every step of SCENARIOS is answered with one message
+        self.expected = Counter()
+        self._types = importlib.import_module('telebot.types')
+        if bot_main is None:
+            return
+        enqueue = bot_main.sender.enqueue
+
+        def counting_enqueue(chat_id, method, *args, **kwargs):
+            self.expected[chat_id] += 1
+            return enqueue(chat_id, method, *args, **kwargs)
+        bot_main.sender.enqueue = counting_enqueue
+
+    async def step(self, chat_id: int, text: str, name: str):
+        update = make_update(next(self.update_ids), chat_id, text)
+        started = time.perf_counter()
+        if self.bot is None:
+            self.expected[chat_id] += 1
+            self.telegram.push(update)
+        else:
+            await self.bot.process_new_updates([self._types.Update.de_json(update)])
+        try:
+            await self.telegram.wait_for(chat_id, self.expected[chat_id], self.args.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts[name] += 1
+            return
+        self.latencies[name].append(time.perf_counter() - started)
+
+    async def chat(self, chat_id: int, slots: asyncio.Semaphore):
+        async with slots:
+            city = self.random.choices(self.cities, self.city_weights)[0]
+            steps = list(SET_CITY)
+            for command in self.random.choices(self.args.commands, k=self.args.commands_per_chat):
+                steps.extend(SCENARIOS[command])
+            for text, name in steps:
+                await self.step(chat_id, text.format(city=city, days=self.random.randint(2, 10)), name)
+
+    async def run(self) -> float:
+        slots = asyncio.Semaphore(self.args.concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(*(self.chat(chat_id, slots) for chat_id in range(1, self.args.chats + 1)))
+        return time.perf_counter() - started
+
+
+def report(args, elapsed: float, test: LoadTest, api: FakeWeatherApi, telegram: FakeTelegram,
+           cache_stats: dict) -> dict:
+    steps = {}
+    everything = sorted(itertools.chain.from_iterable(test.latencies.values()))
+    for name, values in [('all', everything)] + sorted(test.latencies.items()):
+        values = sorted(values)
+        steps[name] = {'count': len(values), 'p50': percentile(values, 50), 'p90': percentile(values, 90),
+                       'p99': percentile(values, 99), 'max': values[-1]} if values else {'count': 0}
+    return {
+        'args': {key: value for key, value in vars(args).items() if key not in ('json', 'compare')},
+        'elapsed': elapsed,
+        'throughput': len(everything) / elapsed,
+        'steps': steps,
+        'timeouts': dict(test.timeouts),
+        'weatherapi_calls': dict(api.calls),
+        'weatherapi_injected_errors': dict(api.errors),
+        'telegram_calls': dict(telegram.calls),
+        'telegram_429': telegram.flooded,
+        'cache': cache_stats,
+    }
+
+
+def print_report(result: dict, baseline: dict = None):
+    def delta(value, old):
+        return f" ({(value - old) / old * 100:+.0f}%)" if old else ''
+
+    steps = result['steps']
+    old_steps = baseline['steps'] if baseline else {}
+    throughput_delta = delta(result['throughput'], baseline['throughput']) if baseline else ''
+    print(f"{result['args']['chats']} chats, {steps['all']['count']} steps in {result['elapsed']:.2f}s: "
+          f"{result['throughput']:.0f} steps/s{throughput_delta}")
+    print(f"{'step':<28}{'count':>7}{'p50 ms':>16}{'p90 ms':>16}{'p99 ms':>16}{'max ms':>10}")
+    for name, stats in steps.items():
+        if not stats['count']:
+            continue
+        old = old_steps.get(name, {})
+        cells = [f"{stats[p] * 1e3:.1f}{delta(stats[p], old.get(p))}" for p in ('p50', 'p90', 'p99')]
+        cells = ''.join(f'{cell:>16}' for cell in cells)
+        print(f"{name:<28}{stats['count']:>7}{cells}{stats['max'] * 1e3:>10.1f}")
+    calls = result['weatherapi_calls']
+    old_calls = sum(baseline['weatherapi_calls'].values()) if baseline else 0
+    print(f"weatherapi.com calls: {sum(calls.values())}{delta(sum(calls.values()), old_calls)} {calls}, "
+          f"per step {sum(calls.values()) / max(steps['all']['count'], 1):.2f}")
+    if result['weatherapi_injected_errors']:
+        print(f"injected upstream errors: {result['weatherapi_injected_errors']}")
+    print(f"telegram calls: {result['telegram_calls']}, 429: {result['telegram_429']}")
+    if result['cache']:
+        print(f"response cache: {result['cache']}")
+    if result['timeouts']:
+        print(f"steps without replies after {result['args']['timeout']}s: {result['timeouts']}")
+
+
+async def run_bot_process(args, test: LoadTest, telegram: FakeTelegram) -> float:
+    """
+        Starts main.py, runs the chats once it polls for updates and stops it with Ctrl+C (SIGINT).
+        """
+    bot = subprocess.Popen([sys.executable, os.path.join(ROOT, 'main.py')], cwd=ROOT,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL if args.log_level != 'DEBUG' else None)
+    try:
+        started = time.monotonic()
+        while not telegram.calls['getUpdates']:
+            if bot.poll() is not None or time.monotonic() - started > args.timeout:
+                raise RuntimeError(f"main.py didn't start polling, exit code {bot.returncode}")
+            await asyncio.sleep(0.1)
+        return await test.run()
+    finally:
+        bot.send_signal(signal.SIGINT)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, bot.wait, 30)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+
+
+async def run(args) -> dict:
+    api = FakeWeatherApi(args.latency, args.jitter, args.error_rate, args.seed)
+    telegram = FakeTelegram(args.flood_limit)
+    await api.start(port=args.api_port)
+    await telegram.start(port=args.telegram_port)
+    if args.workers:
+        test = LoadTest(args, telegram)
+        try:
+            elapsed = await run_bot_process(args, test, telegram)
+        finally:
+            await telegram.stop()
+            await api.stop()
+        return report(args, elapsed, test, api, telegram, {})
+    bot_main = importlib.import_module('main')
+    logging.getLogger().setLevel(args.log_level)
+    from helpers import close_session
+    from cache import response_cache
+    test = LoadTest(args, telegram, bot_main)
+    bot_main.sender.start(bot_main.bot)
+    try:
+        elapsed = await test.run()
+    finally:
+        await bot_main.sender.stop()
+        await bot_main.bot.close_session()
+        await close_session()
+        await telegram.stop()
+        await api.stop()
+    return report(args, elapsed, test, api, telegram, response_cache.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100, help='chats active at the same time')
+    parser.add_argument('--commands', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--commands-per-chat', type=int, default=3)
+    parser.add_argument('--cities', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='median weatherapi.com latency, seconds')
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of weatherapi.com requests failing')
+    parser.add_argument('--flood-limit', type=float, default=0, help='Telegram messages per second before 429')
+    parser.add_argument('--api-rate', type=float, default=1000, help='WEATHER_API_RATE of the bot')
+    parser.add_argument('--telegram-rate', type=float, default=1000, help='TELEGRAM_GLOBAL_RATE of the bot')
+    parser.add_argument('--chat-interval', type=float, default=0, help='TELEGRAM_CHAT_INTERVAL of the bot')
+    parser.add_argument('--history-db', default='', help='history store to use, a fresh one by default')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='run main.py with WORKERS=N in its own process(es), 0 - drive the handlers in this one')
+    parser.add_argument('--api-port', type=int, default=8766)
+    parser.add_argument('--telegram-port', type=int, default=8767)
+    parser.add_argument('--timeout', type=float, default=30, help='seconds to wait for the replies of a step')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', help='results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    configure(args)
+    result = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
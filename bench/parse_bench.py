@@ -0,0 +1,51 @@
+"""
+Cost of turning a weatherapi.com response into WeatherData: parsing the bytes into dicts first
+versus validating the bytes directly, with all 24 hourly records per day and with one (hour=12).
+
+    python bench/parse_bench.py --days 10
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import payloads
+from models import WeatherData
+
+
+def via_dict(body: bytes):
+    return WeatherData.model_validate(json.loads(body))
+
+
+def via_json(body: bytes):
+    return WeatherData.model_validate_json(body)
+
+
+def peak_memory(func, body: bytes) -> int:
+    tracemalloc.start()
+    func(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    for hour_param in (None, 12):
+        body = json.dumps(payloads.forecast('Moskva', args.days, hour_param)).encode()
+        print(f"forecast.json, {args.days} days, hour={hour_param}: {len(body) / 1024:.0f} KiB")
+        for func in (via_dict, via_json):
+            seconds = min(timeit.repeat(lambda: func(body), number=args.number, repeat=5)) / args.number
+            print(f"  {func.__name__}: {seconds * 1e3:.2f} ms, peak {peak_memory(func, body) / 1024:.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+weatherapi.com-shaped payloads with all the fields of the real api (hourly data included),
+used by the stand-in servers and the micro benchmarks.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+CONDITIONS = [
+    (1000, 'Sunny'), (1003, 'Partly cloudy'), (1006, 'Cloudy'), (1009, 'Overcast'), (1030, 'Mist'),
+    (1063, 'Patchy rain possible'), (1066, 'Patchy snow possible'), (1135, 'Fog'), (1153, 'Light drizzle'),
+    (1183, 'Light rain'), (1189, 'Moderate rain'), (1195, 'Heavy rain'), (1213, 'Light snow'),
+    (1219, 'Moderate snow'), (1240, 'Light rain shower'), (1273, 'Patchy light rain with thunder'),
+]
+WIND_DIRS = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
+
+
+def condition(rnd: random.Random) -> dict:
+    code, text = rnd.choice(CONDITIONS)
+    return {'text': text, 'icon': f'//cdn.weatherapi.com/weather/64x64/day/{code % 1000}.png', 'code': code}
+
+
+def location(q: str) -> dict:
+    rnd = random.Random(q)
+    return {
+        'name': q.strip().title() or 'Moscow', 'region': 'Moscow City', 'country': 'Russia',
+        'lat': round(rnd.uniform(-60, 70), 2), 'lon': round(rnd.uniform(-180, 180), 2), 'tz_id': 'Europe/Moscow',
+        'localtime_epoch': int(datetime.now().timestamp()), 'localtime': datetime.now().strftime('%Y-%m-%d %H:%M'),
+    }
+
+
+def current(rnd: random.Random) -> dict:
+    temp = round(rnd.uniform(-20, 30), 1)
+    wind = round(rnd.uniform(0, 40), 1)
+    return {
+        'last_updated_epoch': int(datetime.now().timestamp()), 'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M'),
+        'temp_c': temp, 'temp_f': round(temp * 1.8 + 32, 1), 'is_day': 1, 'condition': condition(rnd),
+        'wind_mph': round(wind / 1.609, 1), 'wind_kph': wind, 'wind_degree': rnd.randint(0, 359),
+        'wind_dir': rnd.choice(WIND_DIRS), 'pressure_mb': 1015.0, 'pressure_in': 29.97, 'precip_mm': 0.0,
+        'precip_in': 0.0, 'humidity': rnd.randint(20, 100), 'cloud': rnd.randint(0, 100),
+        'feelslike_c': round(temp - 2, 1), 'feelslike_f': round((temp - 2) * 1.8 + 32, 1), 'vis_km': 10.0,
+        'vis_miles': 6.0, 'uv': 3.0, 'gust_mph': round(wind / 1.2, 1), 'gust_kph': round(wind * 1.3, 1),
+    }
+
+
+def hour(rnd: random.Random, day: date, h: int) -> dict:
+    temp = round(rnd.uniform(-20, 30), 1)
+    return {
+        'time_epoch': int(datetime(day.year, day.month, day.day, h).timestamp()),
+        'time': f'{day} {h:02}:00', 'temp_c': temp, 'temp_f': round(temp * 1.8 + 32, 1), 'is_day': int(6 <= h < 20),
+        'condition': condition(rnd), 'wind_mph': 5.6, 'wind_kph': 9.0, 'wind_degree': rnd.randint(0, 359),
+        'wind_dir': rnd.choice(WIND_DIRS), 'pressure_mb': 1015.0, 'pressure_in': 29.97, 'precip_mm': 0.0,
+        'precip_in': 0.0, 'snow_cm': 0.0, 'humidity': rnd.randint(20, 100), 'cloud': rnd.randint(0, 100),
+        'feelslike_c': temp, 'feelslike_f': round(temp * 1.8 + 32, 1), 'windchill_c': temp,
+        'windchill_f': round(temp * 1.8 + 32, 1), 'heatindex_c': temp, 'heatindex_f': round(temp * 1.8 + 32, 1),
+        'dewpoint_c': round(temp - 5, 1), 'dewpoint_f': round((temp - 5) * 1.8 + 32, 1), 'will_it_rain': 0,
+        'chance_of_rain': rnd.randint(0, 100), 'will_it_snow': 0, 'chance_of_snow': rnd.randint(0, 100),
+        'vis_km': 10.0, 'vis_miles': 6.0, 'gust_mph': 8.1, 'gust_kph': 13.0, 'uv': 1.0,
+    }
+
+
+def forecast_day(q: str, day: date, hours: range = range(24)) -> dict:
+    rnd = random.Random(f'{q}{day}')
+    mintemp = round(rnd.uniform(-25, 20), 1)
+    maxtemp = round(mintemp + rnd.uniform(2, 12), 1)
+    avgtemp = round((mintemp + maxtemp) / 2, 1)
+    maxwind = round(rnd.uniform(5, 50), 1)
+    return {
+        'date': str(day),
+        'date_epoch': int(datetime(day.year, day.month, day.day).timestamp()),
+        'day': {
+            'maxtemp_c': maxtemp, 'maxtemp_f': round(maxtemp * 1.8 + 32, 1), 'mintemp_c': mintemp,
+            'mintemp_f': round(mintemp * 1.8 + 32, 1), 'avgtemp_c': avgtemp, 'avgtemp_f': round(avgtemp * 1.8 + 32, 1),
+            'maxwind_mph': round(maxwind / 1.609, 1), 'maxwind_kph': maxwind, 'totalprecip_mm': 0.5,
+            'totalprecip_in': 0.02, 'totalsnow_cm': 0.0, 'avgvis_km': 9.8, 'avgvis_miles': 6.0,
+            'avghumidity': rnd.randint(30, 100), 'daily_will_it_rain': 0, 'daily_chance_of_rain': rnd.randint(0, 100),
+            'daily_will_it_snow': 0, 'daily_chance_of_snow': rnd.randint(0, 100), 'condition': condition(rnd),
+            'uv': 2.0,
+        },
+        'astro': {
+            'sunrise': '07:12 AM', 'sunset': '05:40 PM', 'moonrise': '10:01 PM', 'moonset': '01:15 PM',
+            'moon_phase': 'Waning Gibbous', 'moon_illumination': 71, 'is_moon_up': 0, 'is_sun_up': 0,
+        },
+        'hour': [hour(rnd, day, h) for h in hours],
+    }
+
+
+def hours(hour_param) -> range:
+    """
+        weatherapi.com returns only the requested hour when the hour parameter is given.
+        """
+    return range(24) if hour_param is None else range(int(hour_param), int(hour_param) + 1)
+
+
+def forecast(q: str, days: int = 1, hour_param=None) -> dict:
+    today = date.today()
+    return {
+        'location': location(q),
+        'current': current(random.Random(q)),
+        'forecast': {'forecastday': [forecast_day(q, today + timedelta(days=n), hours(hour_param))
+                                     for n in range(days)]},
+    }
+
+
+def history(q: str, dt: str, hour_param=None, end_dt: str = None) -> dict:
+    first = date.fromisoformat(dt)
+    days = (date.fromisoformat(end_dt) - first).days + 1 if end_dt else 1
+    return {
+        'location': location(q),
+        'forecast': {'forecastday': [forecast_day(q, first + timedelta(days=n), hours(hour_param))
+                                     for n in range(max(days, 1))]},
+    }
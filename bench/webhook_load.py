@@ -0,0 +1,68 @@
+"""
+Posts synthetic Telegram updates to a running bot in webhook mode and reports how fast they were accepted.
+
+    python bench/webhook_load.py --url http://127.0.0.1:8888/webhook --updates 5000 --chats 1000
+"""
+import time
+import asyncio
+import argparse
+import itertools
+from collections import Counter
+import aiohttp
+
+COMMANDS = ['/current_weather', '/weather_statistic', '/prediction', '/help']
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return {'update_id': update_id, 'message': message}
+
+
+async def post_updates(url: str, updates: int, chats: int, concurrency: int, secret: str) -> Counter:
+    statuses = Counter()
+    update_ids = itertools.count(1)
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+
+    async def sender(session):
+        for update_id in update_ids:
+            if update_id > updates:
+                return
+            update = make_update(update_id, update_id % chats + 1, COMMANDS[update_id % len(COMMANDS)])
+            try:
+                async with session.post(url, json=update, headers=headers) as response:
+                    statuses[response.status] += 1
+            except aiohttp.ClientError as e:
+                statuses[type(e).__name__] += 1
+
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(concurrency)))
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8888/webhook')
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--secret', default='')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    statuses = asyncio.run(post_updates(args.url, args.updates, args.chats, args.concurrency, args.secret))
+    elapsed = time.perf_counter() - started
+    print(f"{args.updates} updates in {elapsed:.2f}s: {args.updates / elapsed:.0f} updates/s")
+    for status, count in sorted(statuses.items(), key=str):
+        print(f"  {status}: {count}")
+
+
+if __name__ == '__main__':
+    main()
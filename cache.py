@@ -0,0 +1,161 @@
+import time
+import heapq
+import asyncio
+from collections import OrderedDict
+from datetime import date
+from urllib.parse import urlsplit, parse_qsl
+from metrics import Counter, Gauge
+from config import CACHE_SIZE, CACHE_TTL_CURRENT, CACHE_TTL_FORECAST
+
+
+class TTLCache:
+    """
+        LRU cache whose entries expire after their own ttl (None - never expire).
+        hits and misses count the lookups since the start of the bot.
+        """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expiry time or None, value)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is not None:
+            expires, value = item
+            if expires is None or expires > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl):
+        self._data[key] = (None if ttl is None else time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def expires(self, key):
+        """
+            Monotonic time the entry expires at: None - never, 0 - not cached.
+            """
+        item = self._data.get(key)
+        return 0 if item is None else item[0]
+
+    def stats(self) -> dict:
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+class SingleFlight:
+    """
+        Concurrent calls with the same key wait for one execution and share its result (or exception).
+        shared counts the calls that didn't have to run on their own.
+        """
+
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}  # key -> task of the call in flight
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key, func):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.shared += 1
+        # shield: a caller that gives up doesn't cancel the request for the others
+        return await asyncio.shield(task)
+
+
+class Popularity:
+    """
+        Request counts per location that fade with every decay(), so the top follows the recent traffic.
+        At most maxsize locations are tracked, the least requested are forgotten first.
+        """
+
+    def __init__(self, maxsize: int = 10000, factor: float = 0.5):
+        self.maxsize = maxsize
+        self.factor = factor
+        self._counts = {}  # location -> decayed number of requests
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, location: str):
+        self._counts[location] = self._counts.get(location, 0) + 1
+        if len(self._counts) > 2 * self.maxsize:
+            self._counts = dict(heapq.nlargest(self.maxsize, self._counts.items(), key=lambda item: item[1]))
+
+    def top(self, k: int) -> list:
+        return heapq.nlargest(k, self._counts, key=self._counts.get)
+
+    def decay(self):
+        self._counts = {location: count * self.factor for location, count in self._counts.items()
+                        if count * self.factor >= 0.1}
+
+
+def normalize_location(location: str) -> str:
+    return ' '.join(location.lower().split())
+
+
+def cache_key(api_url: str) -> tuple:
+    """
+        Key of a weatherapi.com request: endpoint, normalized location, date and number of days.
+        The api key and the output options are not part of the key.
+        """
+    url = urlsplit(api_url)
+    params = dict(parse_qsl(url.query))
+    endpoint = url.path.rsplit('/', 1)[-1].removesuffix('.json')
+    location = normalize_location(params.get('q', ''))
+    days = params.get('days', '1') if endpoint == 'forecast' else None
+    return endpoint, location, params.get('dt'), days
+
+
+def is_past_day(key: tuple) -> bool:
+    endpoint, location, dt, days = key
+    return endpoint == 'history' and dt is not None and dt < date.today().isoformat()
+
+
+def is_complete_day(dt: str, data) -> bool:
+    """
+        dt is over where the location is. The server's date (UTC in docker) is a day ahead of the locations west of it
+        for a part of every day, their "yesterday" is still going on; weatherapi.com gives the local time.
+        """
+    return dt < data.location.localtime[:10]
+
+
+def cache_ttl(key: tuple, data=None):
+    """
+        Seconds to keep a response: the weather of past days and the search results never change,
+        so they are kept until evicted. A past day of the server that isn't over at the location of data
+        is kept like today's.
+        """
+    endpoint, location, dt, days = key
+    if endpoint == 'search' or is_past_day(key) and (data is None or is_complete_day(dt, data)):
+        return None
+    if endpoint == 'history':
+        return CACHE_TTL_CURRENT
+    if endpoint == 'current':
+        return CACHE_TTL_CURRENT
+    return CACHE_TTL_FORECAST
+
+
+response_cache = TTLCache(CACHE_SIZE)
+inflight_requests = SingleFlight()
+location_popularity = Popularity()
+
+Gauge('weather_cache_entries', 'Responses in the response cache', func=lambda: len(response_cache))
+Counter('weather_cache_hits_total', 'Lookups served from the response cache', func=lambda: response_cache.hits)
+Counter('weather_cache_misses_total', 'Lookups not found in the response cache', func=lambda: response_cache.misses)
+Gauge('weather_requests_in_flight', 'Distinct weatherapi.com requests in progress', func=lambda: len(inflight_requests))
+Counter('weather_requests_shared_total', 'Requests that joined an identical one in progress',
+        func=lambda: inflight_requests.shared)
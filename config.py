@@ -0,0 +1,72 @@
+import os
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+# weatherapi.com base url, can be pointed at a local stand-in server for load testing
+WEATHER_API_URL = os.getenv('WEATHER_API_URL', 'http://api.weatherapi.com/v1').rstrip('/')
+
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 100))  # max simultaneous connections to weatherapi.com
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 10))  # seconds for a whole upstream request
+
+# weatherapi.com response cache
+CACHE_SIZE = int(os.getenv('CACHE_SIZE', 10000))  # max cached responses, least recently used are evicted first
+CACHE_TTL_CURRENT = int(os.getenv('CACHE_TTL_CURRENT', 120))  # seconds, current weather and today's history
+CACHE_TTL_FORECAST = int(os.getenv('CACHE_TTL_FORECAST', 600))  # seconds, forecasts (they carry the current weather too)
+
+# forecasts of the most requested locations are renewed in the background before they expire
+PREWARM_TOP_K = int(os.getenv('PREWARM_TOP_K', 50))  # locations kept warm, 0 - off
+PREWARM_INTERVAL = float(os.getenv('PREWARM_INTERVAL', CACHE_TTL_FORECAST * 0.8))  # seconds between renewals of one
+
+HISTORY_DB = os.getenv('HISTORY_DB', 'data/history.sqlite3')  # SQLite file with the weather of past days
+# days summarized by /weather_statistic, the longest one is kept in the history store for every requested location
+STATS_WINDOWS = tuple(sorted(int(days) for days in os.getenv('STATS_WINDOWS', '7,30,90').split(',')))
+
+LOCATION_GRID = float(os.getenv('LOCATION_GRID', 0.1))  # degrees, shared locations in one cell get the same weather
+
+DEFAULT_CITY = os.getenv('DEFAULT_CITY', 'Moskva')  # city of a chat that hasn't chosen one
+SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', 7 * 24 * 3600))  # seconds before an idle chat is forgotten
+SESSIONS_SNAPSHOT = os.getenv('SESSIONS_SNAPSHOT', '')  # file to keep chosen cities between restarts, empty - off
+
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # polling - getUpdates long polling, webhook - Telegram posts updates
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')  # public https url of the bot, e.g. the ngrok domain
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8888))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # checked against X-Telegram-Bot-Api-Secret-Token if set
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 32))  # updates processed at the same time
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))  # updates waiting for a worker before 503
+
+# updates are received by one process and handed to WORKERS processes by chat id, 1 - everything in one process.
+# Rates below are for the whole bot, every worker gets an equal share of them.
+WORKERS = int(os.getenv('WORKERS', 1))
+# SQLite file with the responses shared by the workers, empty - every worker keeps its own only
+SHARED_CACHE_DB = os.getenv('SHARED_CACHE_DB', 'data/cache.sqlite3' if WORKERS > 1 else '')
+
+# weatherapi.com request rate shared by all handlers, set it to the plan quota
+WEATHER_API_RATE = float(os.getenv('WEATHER_API_RATE', 10))  # requests per second
+WEATHER_API_BURST = int(os.getenv('WEATHER_API_BURST', 20))  # requests allowed at once after a quiet period
+WEATHER_API_RETRIES = int(os.getenv('WEATHER_API_RETRIES', 3))  # extra attempts on 429, 5xx and error 9999
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', 0.5))  # seconds, doubled on every attempt
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 8))
+
+FORECAST_FORMAT = os.getenv('FORECAST_FORMAT', 'full')  # multi-day reports: full - detailed days, table - compact table
+# on - /weather_statistic and /prediction answer at once with a placeholder edited as the data comes in,
+# off - one complete message at the end (every edit is one more Telegram request of the chat)
+STREAMING = os.getenv('STREAMING', 'off')
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()  # DEBUG for the details of every request
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text - one readable line per record, json - one JSON object per record
+# share of handled messages whose INFO and DEBUG lines are written, warnings and errors are always written
+LOG_SAMPLE = float(os.getenv('LOG_SAMPLE', 1))
+
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '').rstrip('/')  # local Bot API server, empty - api.telegram.org
+
+# outgoing Telegram messages, see https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))  # messages per second for the whole bot
+TELEGRAM_CHAT_INTERVAL = float(os.getenv('TELEGRAM_CHAT_INTERVAL', 1))  # seconds between messages to one chat
+SENDER_WORKERS = int(os.getenv('SENDER_WORKERS', 8))  # Telegram requests in flight at once
+
+# blocking - verify TOKEN and API_KEY before starting, background - start at once and report the result through /ready
+STARTUP_CHECKS = os.getenv('STARTUP_CHECKS', 'blocking')
+STARTUP_CHECK_TIMEOUT = float(os.getenv('STARTUP_CHECK_TIMEOUT', 5))  # seconds for each credential check
+STATUS_PORT = int(os.getenv('STATUS_PORT', 8080))  # /healthz and /ready, 0 - off
@@ -0,0 +1,30 @@
+from datetime import date
+from config import WEATHER_API_URL
+from helpers import get_response
+from models import WeatherData, ForecastForecastDay
+
+# All the forecast commands are served by one forecast.json response per location: today and the 10 days
+# the commands ask about are fetched once, cached and shared, and every command takes the days it shows.
+FORECAST_DAYS = 11
+
+
+def forecast_url(api_key: str, location: str) -> str:
+    # hour=12: one hourly record per day instead of 24, the bot shows daily data only and the payload is ~10x smaller
+    return (f'{WEATHER_API_URL}/forecast.json?key={api_key}&q={location}&days={FORECAST_DAYS}'
+            f'&aqi=no&alerts=no&hour=12')
+
+
+async def get_forecast(message, api_key: str, location: str) -> WeatherData:
+    """
+        The current weather and the forecast for today and the next 10 days,
+        None if the request failed (the user has been told why).
+        """
+    return await get_response(message, forecast_url(api_key, location))
+
+
+def forecast_for_date(weather_data: WeatherData, day: date) -> ForecastForecastDay:
+    """
+        The forecast of day (a date of the location), None if it's outside the forecast.
+        """
+    day = day.isoformat()
+    return next((forecast_day for forecast_day in weather_data.forecast.forecastday if forecast_day.date == day), None)
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from aiohttp import web
+from telebot.async_telebot import AsyncTeleBot
+from helpers import check_bot_token, check_api_key
+from metrics import registry
+from config import STATUS_PORT
+
+
+class Readiness:
+    """
+        Results of the startup checks: None - not finished yet, True - passed, False - failed.
+        """
+
+    def __init__(self):
+        self.checks = {'telegram': None, 'weatherapi': None}
+
+    @property
+    def ready(self) -> bool:
+        return all(self.checks.values())
+
+
+readiness = Readiness()
+
+
+async def run_startup_checks(bot: AsyncTeleBot, api_key: str) -> bool:
+    """
+        Verifies the bot token and the weatherapi.com key at the same time, each check is bounded by a timeout.
+        """
+    telegram, weatherapi = await asyncio.gather(check_bot_token(bot), check_api_key(api_key))
+    readiness.checks.update(telegram=telegram, weatherapi=weatherapi)
+    if not telegram:
+        logging.critical("TOKEN is not set or is empty. Please provide a valid token.")
+    if not weatherapi:
+        logging.critical("API_KEY is not set or is empty. Please provide a valid Api key.")
+    return readiness.ready
+
+
+_tasks = set()  # checks running in the background, asyncio keeps only weak references to them
+
+
+def start_startup_checks(bot: AsyncTeleBot, api_key: str) -> asyncio.Task:
+    """
+        run_startup_checks in the background, the result is reported by /ready.
+        """
+    task = asyncio.create_task(run_startup_checks(bot, api_key))
+    _tasks.add(task)
+    task.add_done_callback(_checks_done)
+    return task
+
+
+def _checks_done(task: asyncio.Task):
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Startup checks failed: {task.exception()!r}")
+
+
+class StatusServer:
+    """
+        Local http endpoints for docker/orchestrator probes: /healthz - the process is up,
+        /ready - the credentials were verified. /metrics - metrics for Prometheus.
+        """
+
+    def __init__(self, port: int = STATUS_PORT):
+        self.port = port
+        self.app = web.Application()
+        self.app.router.add_get('/healthz', self.healthz)
+        self.app.router.add_get('/ready', self.ready)
+        self.app.router.add_get('/metrics', self.metrics)
+        self._runner = None
+
+    async def healthz(self, request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok'})
+
+    async def ready(self, request: web.Request) -> web.Response:
+        return web.json_response(readiness.checks, status=200 if readiness.ready else 503)
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode(),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def start(self):
+        if not self.port:
+            return
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, port=self.port).start()
+        logging.info(f"Status server started on port {self.port}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+status_server = StatusServer()
@@ -1,25 +1,58 @@
 import json
-import requests
-import telebot
+import asyncio
+import aiohttp
 import logging
-import sys
+import time
+from telebot.async_telebot import AsyncTeleBot
+from config import HTTP_POOL_SIZE, HTTP_TIMEOUT, WEATHER_API_URL, WEATHER_API_RETRIES, STARTUP_CHECK_TIMEOUT
+from config import RETRY_MAX_DELAY
+from cache import response_cache, inflight_requests, location_popularity, cache_key, cache_ttl, is_past_day
+from storage import history_store, shared_cache
+from ratelimit import api_limiter, is_transient, backoff_delay, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from models import WeatherData, SearchLocation
+from sender import sender
+from metrics import Counter, Gauge, Histogram, PARSE_BUCKETS, command_label
 
-def check_bot_token(token):
-    url = f"https://api.telegram.org/bot{token}/getMe"
-    response = requests.get(url)
-    info = response.json()
+_session = None  # aiohttp session shared by all weatherapi.com requests
 
-    if response.status_code == 200:
-        logging.info("Token tg bot verified: " + info['result']['username'])
-        return True
-    else:
-        logging.error("Token tg bot not verified")
+fetch_seconds = Histogram('weather_fetch_seconds', 'Time to get the weather data of a message, cache included, by command',
+                          ('command',))
+upstream_seconds = Histogram('weather_upstream_seconds', 'weatherapi.com request time, body included',
+                             ('command', 'endpoint'))
+parse_seconds = Histogram('weather_parse_seconds', 'Time to parse a weatherapi.com response', ('command', 'endpoint'),
+                          PARSE_BUCKETS)
+upstream_responses = Counter('weather_upstream_responses_total', 'weatherapi.com responses by http status',
+                             ('endpoint', 'status'))
+api_errors = Counter('weather_api_errors_total', 'weatherapi.com error codes: 1006 - location not found, '
+                     '1005 - invalid url, 9999 - internal error, ...', ('code',))
+upstream_in_flight = Gauge('weather_upstream_in_flight', 'weatherapi.com requests waiting for the response')
+history_store_hits = Counter('weather_history_store_hits_total', 'Past days served from the history store')
+shared_cache_hits = Counter('weather_shared_cache_hits_total', 'Responses found in the cache of the other workers')
+
+
+async def check_bot_token(bot: AsyncTeleBot, timeout: float = STARTUP_CHECK_TIMEOUT) -> bool:
+    if not bot.token:
+        return False
+    try:
+        info = await asyncio.wait_for(bot.get_me(), timeout)
+    except Exception as e:
+        logging.error(f"Token tg bot not verified: {e!r}")
         return False
+    logging.info("Token tg bot verified: " + info.username)
+    return True
 
 
-def check_api_key(api_key):
-    response = requests.get(f'http://api.weatherapi.com/v1/current.json?key={api_key}&q=Kazan')
-    if response.status_code == 200:
+async def check_api_key(api_key: str, timeout: float = STARTUP_CHECK_TIMEOUT) -> bool:
+    if not api_key:
+        return False
+    try:
+        async with get_session().get(f'{WEATHER_API_URL}/current.json?key={api_key}&q=Kazan',
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            status = response.status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error(f"The API key is not verified: {e!r}")
+        return False
+    if status == 200:
         logging.info("The API key is correct.")
         return True
     else:
@@ -27,142 +60,213 @@ def check_api_key(api_key):
         return False
 
 
-def wind(win_dir: str, wind_kph: float, max_wind_kph: float) -> str:
+def get_session() -> aiohttp.ClientSession:
     """
-        1) translates wind direction from English to Russian
-        2) converts wind speed km/h to m/s
-        Args:
-        win_dir (str): The direction of the wind in English.
-        wind_kph (float): The speed of the wind in kilometers per hour.
-        max_wind_kph (float): The maximum speed of the wind in kilometers per hour.
-        Returns:
-        str: Sentence indicating wind direction, m/s speed and maximum wind speed on that day
+        Returns the shared aiohttp session, creating it inside the running event loop on first use.
+        All handlers go through one connection pool, so keep-alive sockets to weatherapi.com are reused
+        and concurrent requests overlap instead of waiting for each other.
         """
-    direction = {
-        'N': "Северный",
-        'NNE': "Северо-северо-восточный",
-        'NE': "Северо восточный",
-        'ENE': "Восточно-северо-восточный",
-        'E': "Восточный",
-        'ESE': "Восточно-юго-восточный",
-        'SE': "Северный юго-восточный",
-        'SSE': "Юго-юго-восточный",
-        'S': "Южный",
-        'SSW': "Юго-юго-западный",
-        'SW': "Юго западный",
-        'WSW': "Западно-юго-западный",
-        'W': "Западный",
-        'WNW': "Западно-северо-западный",
-        'NW': "Северный западный",
-        'NNW': "Северо-северо-западный"
-    }
-    wind_ms = round(wind_kph / 3.6)
-    max_wind_ms = round(max_wind_kph / 3.6)
-    if win_dir in direction:
-        return f"Ветер {direction[win_dir]} {wind_ms}м/с (с порывами до {max_wind_ms} м/с)"
-    else:
-        logging.debug("Wind direction is unknown.")
-        return "Направление ветра неизвестно"
-
-
-def weather_condition(precipitation: str) -> str:
-    weather_dict = {
-        "Sunny": "Солнечно",
-        "Partly cloudy": "Переменная облачность",
-        "Cloudy": "Облачно",
-        "Overcast": "Пасмурная погода",
-        "Mist": "Туман",
-        "Patchy rain possible": "Возможен кратковременный дождь",
-        "Patchy snow possible": "Возможен кратковременный снег",
-        "Patchy sleet possible": "Возможен кратковременный мокрый снег",
-        "Patchy freezing drizzle possible": "Возможен кратковременный ледяной дождь",
-        "Thundery outbreaks possible": "Возможны грозовые вспышки",
-        "Blowing Snow": "Низовая метель",
-        "Blizzard": "Метель",
-        "Fog": "Туман",
-        "Freezing fog": "Ледяной туман",
-        "Patchy light drizzle": "Небольшой мелкий дождь",
-        "Light drizzle": "Легкая морось",
-        "Freezing drizzle": "Изморозь",
-        "Heavy freezing drizzle": "Сильный ледяной дождь",
-        "Patchy light rain": "Небольшой дождь",
-        "Light rain": "Легкий дождь",
-        "Moderate rain at times": "Временами умеренный дождь",
-        "Moderate rain": "Умеренный дождь",
-        "Heavy rain at times": "Временами сильный дождь",
-        "Heavy rain": "Ливень",
-        "Light freezing rain": "Легкий ледяной дождь",
-        "Moderate or heavy freezing rain": "Умеренный или сильный ледяной дождь",
-        "Light sleet": "Легкий мокрый снег",
-        "Moderate or heavy sleet": "Умеренный или сильный мокрый снег",
-        "Patchy light snow": "Небольшой мелкий снег",
-        "Light snow": "Легкий снег",
-        "Patchy moderate snow": "Неровный умеренный снег",
-        "Moderate snow": "Умеренный снег",
-        "Patchy heavy snow": "Неровный сильный снег",
-        "Heavy snow": "Сильный снегопад",
-        "Ice pellets": "Ледяная крупа",
-        "Light rain shower": "Небольшой дождь моросит",
-        "Moderate or heavy rain shower": "Умеренный или сильный ливень",
-        "Torrential rain shower": "Проливной ливень",
-        "Light sleet showers": "Небольшой ливень с мокрым снегом",
-        "Moderate or heavy sleet showers": "Умеренный или сильный ливень с мокрым снегом",
-        "Light snow showers": "Легкий снегопад",
-        "Moderate or heavy snow showers": "Умеренный или сильный снегопад",
-        "Light showers of ice pellets": "Легкий дождь ледяных крупинок",
-        "Moderate or heavy showers of ice pellets": "Умеренные или сильные ливни ледяной крупы",
-        "Patchy light rain with thunder": "Небольшой дождь с грозой",
-        "Moderate or heavy rain with thunder": "Умеренный или сильный дождь с грозой",
-        "Patchy light snow with thunder": "Небольшой снег с грозой",
-        "Moderate or heavy snow with thunder": "Умеренный или сильный снег с грозой",
-        "Patchy rain nearby": "Возможен кратковременный дождь",
-    }
-    if precipitation.capitalize() in weather_dict:
-        return weather_dict[precipitation]
-    else:
-        logging.error(f"Unknown precipitation: {precipitation}")
-        return precipitation
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT))
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def fetch(api_url: str, priority: int = PRIORITY_INTERACTIVE) -> tuple:
+    """
+        Returns (status, data) of a weatherapi.com request, successful responses are served from response_cache
+        while they are fresh. Past days of history are also looked up in history_store before going upstream.
+        Identical requests made at the same time share one upstream call.
+        Upstream calls wait for api_limiter in order of priority.
+        """
+    key = cache_key(api_url)
+    data = response_cache.get(key)
+    if data is not None:
+        logging.debug("Cache hit: %s", key)
+        return 200, data
+    return await inflight_requests.do(key, lambda: fetch_upstream(api_url, key, priority))
+
+
+async def refresh(api_url: str, priority: int = PRIORITY_BACKGROUND) -> tuple:
+    """
+        Like fetch, but goes upstream even if the response is cached, to renew it before it expires.
+        Refreshes are single-flighted apart from fetch: a user request that missed the cache must not join
+        a refresh waiting for api_limiter behind all the bulk traffic.
+        """
+    key = cache_key(api_url)
+    return await inflight_requests.do(('refresh', key), lambda: fetch_upstream(api_url, key, priority, shared=False))
+
+
+async def fetch_upstream(api_url: str, key: tuple, priority: int, shared: bool = True) -> tuple:
+    endpoint, location, dt, days = key
+    past_day = is_past_day(key)
+    if past_day:
+        data = history_store.get(location, dt)
+        if data is not None:
+            logging.debug("History store hit: %s", key)
+            history_store_hits.inc()
+            response_cache.set(key, data, None)
+            return 200, data
+    if shared and shared_cache is not None:
+        cached = shared_cache.get(key)
+        if cached is not None:
+            expires, body = cached
+            shared_cache_hits.inc()
+            data = parse_response(200, body, endpoint)
+            response_cache.set(key, data, None if expires is None else expires - time.time())
+            return 200, data
+    status, data = await request_with_retry(api_url, endpoint, priority)
+    if status == 200:
+        ttl = cache_ttl(key, data)
+        if past_day and ttl is None:
+            history_store.put(location, dt, data)
+        elif shared_cache is not None:
+            shared_cache.set(key, dump_response(data), ttl)
+        response_cache.set(key, data, ttl)
+    return status, data
 
 
-def get_response(message, api_url: str, bot: telebot.TeleBot) -> json:
+def dump_response(data) -> str:
+    """
+        JSON of parsed response data, parse_response turns it back.
+        """
+    if isinstance(data, list):
+        return json.dumps([item.model_dump() for item in data], ensure_ascii=False)
+    return data.model_dump_json()
+
+
+def parse_response(status: int, body: bytes, endpoint: str):
+    """
+        A successful response is parsed once into WeatherData (a list of SearchLocation for search.json),
+        an error response is returned as the weatherapi.com error dict.
+        json.loads + model_validate is used instead of model_validate_json: with pydantic 2.6 it is faster
+        and allocates less on these payloads (bench/parse_bench.py).
+        """
+    if status == 200:
+        if endpoint == 'search':
+            return [SearchLocation.model_validate(item) for item in json.loads(body)]
+        return WeatherData.model_validate(json.loads(body))
+    try:
+        return json.loads(body)
+    except ValueError:
+        return {'error': {'code': None, 'message': f'HTTP {status}'}}
+
+
+async def request_with_retry(api_url: str, endpoint: str, priority: int) -> tuple:
+    """
+        Requests api_url within the rate limit, transient errors are retried up to WEATHER_API_RETRIES times
+        with jittered exponential backoff. Returns (status, data) of the last attempt.
+        """
+    for attempt in range(WEATHER_API_RETRIES + 1):
+        await api_limiter.acquire(priority)
+        retry_after = None
+        command = command_label()
+        try:
+            with upstream_in_flight.track(), upstream_seconds.time(command, endpoint):
+                async with get_session().get(api_url) as response:
+                    status = response.status
+                    body = await response.read()
+                    if response.headers.get('Retry-After', '').isdigit():
+                        retry_after = int(response.headers['Retry-After'])
+            upstream_responses.inc(endpoint, status)
+            with parse_seconds.time(command, endpoint):
+                data = parse_response(status, body, endpoint)
+            if status != 200:
+                api_errors.inc(data.get('error', {}).get('code'))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            upstream_responses.inc(endpoint, type(e).__name__)
+            if attempt == WEATHER_API_RETRIES:
+                raise
+            logging.warning(f"Upstream request failed ({e!r}), retry {attempt + 1}")
+        else:
+            if not is_transient(status, data) or attempt == WEATHER_API_RETRIES:
+                return status, data
+            if retry_after and retry_after > RETRY_MAX_DELAY:
+                # asked to wait longer than a user would: an earlier retry would be refused too
+                logging.warning(f"Upstream response {status}, Retry-After {retry_after}s, not retried")
+                return status, data
+            logging.warning(f"Upstream response {status}, retry {attempt + 1}")
+        await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+
+def check_response(message, result) -> WeatherData:
+    """
+        Returns the WeatherData of a successful response, otherwise tells the user what went wrong
+        and returns None.
+        Args:
+        result (tuple | Exception): (status, data) returned by fetch or the exception it raised.
+        """
     try:
-        response = requests.get(api_url)
-        data = json.loads(response.text)
-        if response.status_code == 200:
-            logging.debug(f"Response 200")
-            return json.loads(response.text)
-        elif response.status_code == 400:
+        if isinstance(result, Exception):
+            raise result
+        status, data = result
+        if status == 200:
+            logging.debug("Response 200")
+            return data
+        elif status == 400:
             error_code = data['error']['code']
             if error_code == 1006:
-                bot.send_message(message.chat.id, "Город не найден, проверьте правильность названия города")
-                logging.error("Город не найден Response 400: code 1006")
-                exit(1)
+                sender.send_message(message.chat.id, "Город не найден, проверьте правильность названия города")
+                logging.error("Город не найден Response 400: code 1006")
             elif error_code == 9999:
-                bot.send_message("Сервер временно недоступен, попробуйте позже")
+                sender.send_message(message.chat.id, "Сервер временно недоступен, попробуйте позже")
                 logging.error("Сервер временно недоступен Response 400: code 9999")
             elif error_code == 1005:
                 logging.error("URL-адрес запроса API недействителен. Response 400: code 1005")
             else:
                 logging.error("Неизвестная ошибка Response 400")
-                bot.send_message("Неизвестная ошибка")
-        elif response.status_code == 403:
+                sender.send_message(message.chat.id, "Неизвестная ошибка")
+        elif status == 403:
             logging.error(f"Response 403: {data['error']['message']}")
-            bot.send_message("Произошла техническая ошибка, попробуйте позже или обратитесь в поддержку")
+            sender.send_message(message.chat.id,
+                                "Произошла техническая ошибка, попробуйте позже или обратитесь в поддержку")
         else:
-            logging.error(f"Response {response.status_code}: {data['error']['message']}")
-            bot.send_message("Ошибка получения данных о погоде, попробуйте позже")
+            logging.error(f"Response {status}: {data['error']['message']}")
+            sender.send_message(message.chat.id, "Ошибка получения данных о погоде, попробуйте позже")
     except Exception as e:
-        bot.send_message(message.chat.id, f"Произошла ошибка")
+        sender.send_message(message.chat.id, f"Произошла ошибка")
         logging.error(e)
 
-def logging_config():
-    loger = logging.getLogger()
-    loger.setLevel(logging.INFO)
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-    loger.addHandler(handler)
-    return loger
+
+async def get_responses(message, api_urls: list, priority: int = PRIORITY_INTERACTIVE, on_response=None) -> list:
+    """
+        Requests all api_urls at once, the whole batch takes about one round trip to weatherapi.com.
+        Returns the data in the order of api_urls, or None if any request failed; the user is told about
+        the first failure only.
+        on_response(index, data) is called for every successful response as soon as it arrives (streaming).
+        """
+    for location in {cache_key(api_url)[1] for api_url in api_urls}:
+        location_popularity.add(location)
+
+    async def fetch_and_report(index: int, api_url: str) -> tuple:
+        status, data = await fetch(api_url, priority)
+        if status == 200:
+            on_response(index, data)
+        return status, data
+
+    requests = (fetch(api_url, priority) if on_response is None else fetch_and_report(index, api_url)
+                for index, api_url in enumerate(api_urls))
+    with fetch_seconds.time(command_label()):
+        results = await asyncio.gather(*requests, return_exceptions=True)
+    responses = []
+    for result in results:
+        data = check_response(message, result)
+        if data is None:
+            return None
+        responses.append(data)
+    return responses
+
+
+async def get_response(message, api_url: str) -> WeatherData:
+    responses = await get_responses(message, [api_url])
+    return responses[0] if responses else None
 
 
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import aiohttp
+from config import WEATHER_API_URL, LOCATION_GRID, DEFAULT_CITY
+from cache import normalize_location
+from helpers import fetch
+from metrics import Counter
+
+resolved_locations = Counter('weather_locations_resolved_total',
+                             'Cities and shared locations by the result of the search: found, not_found, failed',
+                             ('result',))
+
+_default_city = None  # DEFAULT_CITY resolved, None until a search has found it
+
+
+def snap(latitude: float, longitude: float, grid: float = LOCATION_GRID) -> tuple:
+    """
+        Nearest node of a grid with a step of grid degrees, users close to each other share one location.
+        """
+    return round(round(latitude / grid) * grid, 4), round(round(longitude / grid) * grid, 4)
+
+
+async def resolve(api_key: str, q: str) -> str:
+    """
+        Canonical weatherapi.com q for q: "id:<location id>" of the best search.json match, so all the spellings
+        of a city and all the points around it share the cached responses. q itself if nothing was found.
+        search.json responses are kept in response_cache, a known spelling doesn't go upstream again.
+        """
+    try:
+        status, results = await fetch(f'{WEATHER_API_URL}/search.json?key={api_key}&q={q}')
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        status, results = None, e
+    if status != 200:
+        resolved_locations.inc('failed')
+        logging.warning(f"Location search failed for {q}: {results}")
+        return q
+    if not results:
+        resolved_locations.inc('not_found')
+        return q
+    resolved_locations.inc('found')
+    logging.debug("Location %s: %s, %s, %s", q, results[0].name, results[0].region, results[0].country)
+    return f'id:{results[0].id}'
+
+
+async def resolve_city(api_key: str, text: str) -> str:
+    return await resolve(api_key, normalize_location(text))
+
+
+async def resolve_coords(api_key: str, latitude: float, longitude: float) -> str:
+    latitude, longitude = snap(latitude, longitude)
+    return await resolve(api_key, f'{latitude},{longitude}')
+
+
+async def default_city(api_key: str) -> str:
+    """
+        DEFAULT_CITY resolved like a typed city, once: the chats that never chose a city share the cached
+        responses and the history with those that typed it. A failed search is tried again next time.
+        """
+    global _default_city
+    if _default_city is not None:
+        return _default_city
+    q = await resolve_city(api_key, DEFAULT_CITY)
+    if q.startswith('id:'):
+        _default_city = q
+    return q
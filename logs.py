@@ -0,0 +1,97 @@
+import sys
+import copy
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# (chat id, command, whether its INFO and DEBUG lines are written) of the message the current task handles
+current_request = contextvars.ContextVar('current_request', default=None)
+
+
+class RequestFilter(logging.Filter):
+    """
+        Runs where the line is logged, before the record is queued: adds chat_id and command of the message
+        being handled and drops INFO and DEBUG lines of the requests not sampled. Warnings and errors are always kept.
+        """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request = current_request.get()
+        if request is None:
+            record.chat_id = record.command = None
+            return True
+        record.chat_id, record.command, sampled = request
+        return sampled or record.levelno > logging.INFO
+
+
+class JsonFormatter(logging.Formatter):
+    """
+        One JSON object per line, for log collectors. latency is in seconds, present on the line ending a request.
+        """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': self.formatTime(record), 'level': record.levelname, 'logger': record.name,
+                 'message': record.getMessage(), 'chat_id': getattr(record, 'chat_id', None),
+                 'command': getattr(record, 'command', None)}
+        if hasattr(record, 'latency'):
+            entry['latency'] = record.latency
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+        Merges the arguments into the message before queueing (they may change afterwards), but leaves the traceback
+        to the writer thread: the records keep exc_info, so JsonFormatter can put it in a field of its own.
+        """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+@contextmanager
+def request_context(chat_id: int, command: str):
+    """
+        Marks the lines logged while a message is handled; whether they are written is decided once per message,
+        so a sampled request is logged whole. Ends with a line carrying the handling time.
+        """
+    token = current_request.set((chat_id, command, random.random() < LOG_SAMPLE))
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        latency = time.monotonic() - start
+        logging.info("%s: обработано за %.0f мс", command, latency * 1000,
+                     extra={'latency': round(latency, 4)})
+        current_request.reset(token)
+
+
+def logging_config() -> logging.Logger:
+    """
+        Handlers only put records into a queue, a background thread formats and writes them to stdout,
+        so a slow stdout (a pipe, docker logs) doesn't hold up the event loop.
+        """
+    loger = logging.getLogger()
+    loger.setLevel(LOG_LEVEL)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+    records = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(records)
+    queue_handler.addFilter(RequestFilter())
+    loger.addHandler(queue_handler)
+    listener = QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)  # writes what is left in the queue
+    return loger
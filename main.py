@@ -1,240 +1,233 @@
 import os
+import signal
+import asyncio
 import telebot
 import logging
-from dotenv import load_dotenv, find_dotenv
-from helpers import wind, get_response, weather_condition, check_bot_token, check_api_key, logging_config
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from config import WEATHER_API_URL
+from helpers import get_responses, close_session
+from logs import logging_config
+from forecasts import get_forecast, forecast_for_date
+from locations import resolve_city, resolve_coords, default_city
+from health import run_startup_checks, start_startup_checks, status_server
+from sessions import sessions, snapshot_paths
+from sender import sender
+from prewarm import prewarmer
+from ratelimit import PRIORITY_BULK
+from webhook import run_webhook
+from shards import Ingester, serve_shard, shard_of
+from metrics import timed
+from rendering import forecast_report, statistic_report, current_report, date_report, prediction_report
+from rendering import START_MESSAGE, HELP_MESSAGE, ASK_CITY, ASK_DAYS, BAD_DAYS, BAD_NUMBER, BAD_DATE, NO_WEEK_DATA
+from rendering import ask_date, date_too_far, forecast_unavailable, location_header, statistic_day_text
+from rendering import prediction_forecast, STATISTIC_LOADING, PREDICTION_LOADING, STREAM_FAILED
+from streaming import StreamingMessage
+from stats import load_series
+from config import SESSIONS_SNAPSHOT, BOT_MODE, FORECAST_FORMAT, STARTUP_CHECKS, TELEGRAM_API_URL, STATS_WINDOWS
+from config import WORKERS, STATUS_PORT, STREAMING, DEFAULT_CITY
 from models import *
 from pydantic import ValidationError
 from datetime import date, datetime, timedelta
 
-# TODO: Need to use logging library to print logs. Log level must be adjustable via env variables. Detail logs needed
-#  for debugging should use with debug log level. Logs that used to make clearly what is going on in the app,
-#  can use info log level.
-
 loger = logging_config()
-load_dotenv(find_dotenv())
 
-TOKEN = os.environ['TOKEN']
-if not check_bot_token(TOKEN):
-    logging.critical("TOKEN is not set or is empty. Please provide a valid token.")
-    exit()
+# No network at import: the token and the api key are verified in main()
+TOKEN = os.getenv('TOKEN', '')
+if TELEGRAM_API_URL:
+    asyncio_helper.API_URL = TELEGRAM_API_URL + '/bot{0}/{1}'
+bot = AsyncTeleBot(TOKEN)
+
+API_KEY_weather = os.getenv('API_KEY', '')
+
+
+def register_next_step_handler(message, callback):
+    """
+        AsyncTeleBot has no next step handlers, the next message of the chat is routed to callback by next_step
+        """
+    sessions.get(message.chat.id).step = callback
+
 
-bot = telebot.TeleBot(os.environ['TOKEN'])
+def has_next_step(message) -> bool:
+    session = sessions.peek(message.chat.id)
+    return session is not None and session.step is not None
 
-API_KEY_weather = (os.environ['API_KEY'])
-if not check_api_key(API_KEY_weather):
-    logging.critical("API_KEY is not set or is empty. Please provide a valid Api key.")
-    exit()
 
-city = "Moskva"  # default city to the bot.
+async def chat_city(chat_id: int) -> str:
+    """
+        weatherapi.com q of the chat's location, DEFAULT_CITY (resolved) if the chat hasn't chosen one
+        """
+    city = sessions.get(chat_id).city
+    return await default_city(API_KEY_weather) if city == DEFAULT_CITY else city
+
+
+# Registered first so that an answer to a question is not taken for a command
+@bot.message_handler(func=has_next_step)
+async def next_step(message):
+    session = sessions.get(message.chat.id)
+    step, session.step = session.step, None
+    await step(message)
 
 
 @bot.message_handler(commands=['start'])
-def start_message(message):
+@timed('start')
+async def start_message(message):
     loger.info("Пользователь запустил бота")
     kb_reply = telebot.types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=1)
 
     btn1 = telebot.types.KeyboardButton(text="Определить местоположение",
                                         request_location=True)  # Variable is redeclared in the next line -> useless
     kb_reply.add(btn1)
-    bot.send_message(message.chat.id,
-                     f'Привет! Я - WeatherForecastBot, твой личный помощник для получения точного прогноза погоды.'
-                     f' Я могу предоставить тебе информацию о погоде в любом городе. Просто напиши мне название '
-                     f'города или поделитесь местоположением, и я скажу тебе, что тебя ждет! Начнем?'
-                     f'Вот команды, которые я знаю: \n'
-                     f'/help - помощь\n'
-                     f'/change_city - изменение города\n'
-                     f'/current_weather - текущая погода\n'
-                     f'/weather_forecast - прогноз погоды на нужную дату\n'
-                     f'/forecast_for_several_days - прогноз погоды на несколько дней (от 2 до 10)\n'
-                     f'/weather_statistics - статистика погоды за последние 7 дней\n'
-                     f'/prediction - предсказание средней температуры на 3 дня\n'
-                     f'или просто нажмите меню для отображения всех команд \n', reply_markup=kb_reply)
-    change_city(message)
+    sender.send_message(message.chat.id, START_MESSAGE, reply_markup=kb_reply)
+    await change_city(message)
 
 
 # Обработчик местоположения пользователя
 @bot.message_handler(content_types=['location'])
-def get_coordinates(message):
-    global city
+@timed('location')
+async def get_coordinates(message):
+    session = sessions.get(message.chat.id)
     latitude, longitude = message.location.latitude, message.location.longitude
-    local = f'{latitude},{longitude}'
-    city = local
-    loger.debug(f"Пользователь выбрал город по локации: {city}")
-    weather(message)
+    session.city = await resolve_coords(API_KEY_weather, latitude, longitude)
+    session.coords = (latitude, longitude)
+    session.step = None  # the location answers the city question of /start or /change_city
+    loger.debug("Пользователь выбрал город по локации: %s", session.city)
+    await weather(message)
 
 
 # @bot.message_handler(func=lambda message: message.text == "Изменить город")
 @bot.message_handler(commands=['change_city'])
-def change_city(message):
-    bot.send_message(message.chat.id, "Введите название города:")
-    bot.register_next_step_handler(message, add_city)
+@timed('change_city')
+async def change_city(message):
+    register_next_step_handler(message, add_city)
+    sender.send_message(message.chat.id, ASK_CITY)
 
 
-def add_city(message):
+@timed('add_city')
+async def add_city(message):
     city_user = message.text
-    global city
-    city = city_user
-    loger.info(f"Пользователь сменил город: {city}")
+    session = sessions.get(message.chat.id)
+    session.city, session.coords = await resolve_city(API_KEY_weather, city_user), None
+    loger.info("Пользователь сменил город: %s", session.city)
 
-    weather(message)
+    await weather(message)
 
 
 @bot.message_handler(commands=['help'])
-def help_message(message):
+@timed('help')
+async def help_message(message):
     loger.info("Пользователь запросил помощь")
-    help_messages = (
-        ('help', 'помощь'),
-        ('change_city', 'изменить город'),
-        ('current_weather', 'погода сегодня'),
-        ('weather_forecast', 'погода на нужную дату'),
-        ('forecast_for_several_days', 'погода на несколько дней'),
-        ('weather_statistic', 'статистика за послдение 7 дней'),
-        ('prediction', 'предсказание на 3 дня'),
-    )
-    full_msg = '\n'.join([f'/{command} - {description}' for command, description in help_messages])
-
-    bot.send_message(message.chat.id, full_msg)
+    sender.send_message(message.chat.id, HELP_MESSAGE)
 
 
 @bot.message_handler(commands=['current_weather'])
-def weather(message):
-    loger.info(f"Пользователь запросил погоду сегодня: {city}")
-    url_current = f'http://api.weatherapi.com/v1/forecast.json?key={API_KEY_weather}&q={city}'
+@timed('current_weather')
+async def weather(message):
+    city = await chat_city(message.chat.id)
+    loger.info("Пользователь запросил погоду сегодня: %s", city)
     try:
 
-        data = get_response(message, url_current, bot)
-        weather_data = WeatherData.parse_obj(data)
-        current_weather = weather_data.current
-        forecast = DayDetails.parse_obj(data['forecast']['forecastday'][0]['day'])
-        location = weather_data.location
-        precipitation = Condition.parse_obj(data['forecast']['forecastday'][0]['day']['condition'])
-        current_msg = (
-            f"{location.name} ({location.region}): {location.localtime}\n"
-            f"Температура: {current_weather.temp_c}°C (ощущается как {current_weather.feelslike_c}°C)\n"
-            f"Максимальная температура: {forecast.maxtemp_c}°C\n"
-            f"Минимальная температура: {forecast.mintemp_c}°C\n"
-            f"{wind(current_weather.wind_dir, current_weather.wind_kph, forecast.maxwind_kph)}\n"
-            f"Влажность {current_weather.humidity}% \n"
-            f"Веротность осадков: {forecast.daily_chance_of_rain if current_weather.temp_c > 0 else forecast.daily_chance_of_snow}%\n"
-            f"{weather_condition(precipitation.text)}")
-        bot.send_message(message.chat.id, current_msg)
+        weather_data = await get_forecast(message, API_KEY_weather, city)
+        if weather_data is None:
+            return
+        current_msg = current_report(weather_data.location, weather_data.current, weather_data.forecast.forecastday[0])
+        sender.send_message(message.chat.id, current_msg)
         return loger.info("current_weather: Данные успешно обработаны")
     except Exception as e:
         loger.error(f"Произошла ошибка при выполнении запроса: {e}")
-        bot.send_message(message.chat.id, f"Произошла ошибка при выполнении запроса")
+        sender.send_message(message.chat.id, f"Произошла ошибка при выполнении запроса")
     except ValidationError as e:
         loger.error(f"Неверные данные: {e}")
 
 
-date_difference = []  # list of days between today and specific date for weather forecast
-
-today_date = date.today()
-
-
 @bot.message_handler(commands=['weather_forecast'])
-def weather_forecast(message):
-    max_date = today_date + timedelta(days=10)
-    bot.send_message(message.chat.id, f'Введите дату в формате ГГГГ-ММ-ДД в диапозоне от {today_date} до {max_date}:')
-    bot.register_next_step_handler(message, add_day)
+@timed('weather_forecast')
+async def weather_forecast(message):
+    today = date.today()  # not taken at import: the bot runs for days
+    max_date = today + timedelta(days=10)
+    register_next_step_handler(message, add_day)
+    sender.send_message(message.chat.id, ask_date(today, max_date))
 
 
-def add_day(message):
+@timed('add_day')
+async def add_day(message):
     try:
         input_date = datetime.strptime(message.text, "%Y-%m-%d").date()
-        if (input_date - today_date).days <= 10:
-            date_difference.append((input_date - today_date).days + 1)
-            if len(date_difference) > 1:
-                date_difference.pop(0)
-            get_weather_forecast(message)
+        today = date.today()
+        if (input_date - today).days <= 10:
+            sessions.get(message.chat.id).forecast_day = input_date
+            await get_weather_forecast(message)
             return
         else:
-            max_date = today_date + timedelta(days=10)
-            bot.send_message(message.chat.id, f'Введенная дата должна быть не дальше {max_date}.')
-            loger.debug("add_day: Введенная дата должна быть не дальше {max_date}.")
+            max_date = today + timedelta(days=10)
+            sender.send_message(message.chat.id, date_too_far(max_date))
+            loger.debug("add_day: Введенная дата должна быть не дальше %s.", max_date)
             return
     except ValueError:
-        bot.send_message(message.chat.id, "Неверный формат даты. Введите дату в формате ГГГГ-ММ-ДД")
+        sender.send_message(message.chat.id, BAD_DATE)
         loger.debug("add_day: Неверный формат даты")
-    loger.info(f"Пользователь ввел дату (weather_forecast): {message.text}")
+    loger.info("Пользователь ввел дату (weather_forecast): %s", message.text)
 
 
-def get_weather_forecast(message):
-    loger.info(f"Пользователь запросил прогноз на {date_difference[0]} дней: {city}")
-    url_forecast = f'http://api.weatherapi.com/v1/forecast.json?key={API_KEY_weather}&q={city}&days={date_difference[0]}&aqi=no&alerts=no'
+async def get_weather_forecast(message):
+    session = sessions.get(message.chat.id)
+    city, forecast_day = await chat_city(message.chat.id), session.forecast_day
+    loger.info("Пользователь запросил прогноз на %s: %s", forecast_day, city)
     try:
-        data = get_response(message, url_forecast, bot)
-        weather_data = WeatherData.parse_obj(data)
+        weather_data = await get_forecast(message, API_KEY_weather, city)
+        if weather_data is None:
+            return
         current_weather = weather_data.current
-        correction_num = int(date_difference[0] - 1)
-        forecast_data = ForecastForecastDay.parse_obj(data['forecast']['forecastday'][correction_num])
-        location = weather_data.location
-        precipitation = Condition.parse_obj(data['forecast']['forecastday'][0]['day']['condition'])
-        forecast_weather_msg = (
-            f"Предоставлен прогноз на {forecast_data.date}\n"
-            f"{location.name} ({location.region}):\n"
-            f"Максимальная температура: {forecast_data.day.maxtemp_c}°C\n"
-            f"Минимальная температура: {forecast_data.day.mintemp_c}°C\n"
-            f"{wind(current_weather.wind_dir, current_weather.wind_kph, forecast_data.day.maxwind_kph)}\n"
-            f"Влажность {forecast_data.day.avghumidity}% \n"
-            f"Веротность осадков: {forecast_data.day.daily_chance_of_rain if forecast_data.day.avgtemp_c > 0 else forecast_data.day.daily_chance_of_snow}%\n"
-            f"{weather_condition(precipitation.text)}")
-        bot.send_message(message.chat.id, forecast_weather_msg)
-        loger.info(f"weather_forecast: Данные успешно обработаны")
+        forecast_data = forecast_for_date(weather_data, forecast_day)
+        if forecast_data is None:
+            sender.send_message(message.chat.id, forecast_unavailable(forecast_day))
+            return
+        forecast_weather_msg = date_report(weather_data.location, current_weather, forecast_data)
+        sender.send_message(message.chat.id, forecast_weather_msg)
+        loger.info("weather_forecast: Данные успешно обработаны")
     except Exception as e:
-        bot.send_message(message.chat.id, f"Произошла ошибка")
+        sender.send_message(message.chat.id, f"Произошла ошибка")
         loger.error(f"weather_forecast: Ошибка при обработке данных {e}")
     except ValidationError as e:
-        bot.send_message(message.chat.id, f"Произошла ошибка при обработке данных")
+        sender.send_message(message.chat.id, f"Произошла ошибка при обработке данных")
         loger.error(f"weather_forecast: Неверные данные {e}")
 
 
 @bot.message_handler(commands=['forecast_for_several_days'])
-def forecast_for_several_days(message):
-    bot.send_message(message.chat.id,
-                     f'В данном разделе можно получить прогноз погоды на несколько дней.\n'
-                     f' Введите количество дней(от 1 до 10):')
-    bot.register_next_step_handler(message, get_forecast_several)
+@timed('forecast_for_several_days')
+async def forecast_for_several_days(message):
+    register_next_step_handler(message, get_forecast_several)
+    sender.send_message(message.chat.id, ASK_DAYS)
 
 
-def get_forecast_several(message):
+@timed('get_forecast_several')
+async def get_forecast_several(message):
+    city = await chat_city(message.chat.id)
     try:
         qty_days = int(message.text)
-        loger.info(f"Пользователь запросил прогноз на {qty_days} дней: {city}")
+        loger.info("Пользователь запросил прогноз на %s дней: %s", qty_days, city)
         if qty_days >= 1 and qty_days <= 10:
             qty_days += 1
         else:
-            bot.send_message(message.chat.id, 'Количество дней должно быть от 1 до 10')
+            sender.send_message(message.chat.id, BAD_DAYS)
+            return
     except ValueError:
-        bot.send_message(message.chat.id, 'Неверный формат ввода')
+        sender.send_message(message.chat.id, BAD_NUMBER)
         loger.debug("forecast_for_several_days: Неверный формат ввода")
         return
 
-    url_forecast_several = f'http://api.weatherapi.com/v1/forecast.json?key={API_KEY_weather}&q={city}&days={qty_days}&aqi=no&alerts=no'
     try:
-        data = get_response(message, url_forecast_several, bot)
-        weather_data = WeatherData.parse_obj(data)
-        current_weather = weather_data.current
-        location = weather_data.location
-
-        for day_num in range(1, len(data['forecast']['forecastday'])):
-            precipitation = Condition.parse_obj(data['forecast']['forecastday'][day_num]['day']['condition'])
-            forecast_data = ForecastForecastDay.parse_obj(data['forecast']['forecastday'][day_num])
-
-            forecast_msg = (
-                f"Прогноз на {forecast_data.date}\n"
-                f"{location.name} ({location.region}):\n"
-                f"Максимальная температура: {forecast_data.day.maxtemp_c}°C\n"
-                f"Минимальная температура: {forecast_data.day.mintemp_c}°C\n"
-                f"{wind(current_weather.wind_dir, current_weather.wind_kph, forecast_data.day.maxwind_kph)}\n"
-                f"Влажность {forecast_data.day.avghumidity}% \n"
-                f"Вероятность осадков: {forecast_data.day.daily_chance_of_rain if forecast_data.day.avgtemp_c > 0 else forecast_data.day.daily_chance_of_snow}%\n"
-                f"{weather_condition(precipitation.text)}")
-
-            bot.send_message(message.chat.id, forecast_msg)
-        loger.info(f"several forecast : Данные успешно обработаны")
+        weather_data = await get_forecast(message, API_KEY_weather, city)
+        if weather_data is None:
+            return
+        table = FORECAST_FORMAT == 'table'
+        # all days go in one message (or as few as the Telegram limit allows) instead of one message per day
+        for forecast_msg in forecast_report(weather_data.location, weather_data.current,
+                                            weather_data.forecast.forecastday[1:qty_days], table):
+            sender.send_message(message.chat.id, forecast_msg, parse_mode='HTML' if table else None)
+        loger.info("several forecast : Данные успешно обработаны")
     except Exception as e:
-        bot.send_message(message.chat.id, f"Произошла ошибка")
+        sender.send_message(message.chat.id, f"Произошла ошибка")
         loger.error(f"several forecast : Ошибка при обработке данных {e}")
     except ValidationError as e:
         loger.error(e)
@@ -242,82 +235,187 @@ def get_forecast_several(message):
 
 
 @bot.message_handler(commands=['weather_statistic'])
-def statistic(message):
+@timed('weather_statistic')
+async def statistic(message):
+    city = await chat_city(message.chat.id)
     try:
-        loger.info(f"Пользователь запросил статистику: {city}")
-        for days in range(7):
-            statistic_date = today_date - timedelta(days=days)
-            url_statistic = f'https://api.weatherapi.com/v1/history.json?key={API_KEY_weather}&q={city}&dt={statistic_date}'
-            data = get_response(message, url_statistic, bot)
-            day_details = DayDetails.parse_obj(data['forecast']['forecastday'][0]['day'])
-            day_details_data = data['forecast']['forecastday'][0]['date']
-            precipitation = Condition.parse_obj(data['forecast']['forecastday'][0]['day']['condition'])
-
-            location = Locations.parse_obj(data['location'])
-            msg_statistic = (
-                f"{location.name} ({location.region}):  {day_details_data}\n"
-                f"Температура: Max: {day_details.maxtemp_c}°C, Min: {day_details.mintemp_c}°C, {weather_condition(precipitation.text)} \n"
-            )
-
-            bot.send_message(message.chat.id, msg_statistic)
-        loger.info(f"statistic : Данные успешно обработаны")
+        loger.info("Пользователь запросил статистику: %s", city)
+        today = date.today()
+        urls_statistic = [
+            f'{WEATHER_API_URL}/history.json?key={API_KEY_weather}&q={city}&dt={today - timedelta(days=days)}&hour=12'
+            for days in range(7)]
+        stream = None
+        on_response = None
+        if STREAMING == 'on':
+            # every day is shown as soon as its response arrives, in whatever order they come
+            stream = StreamingMessage(message.chat.id, STATISTIC_LOADING, len(urls_statistic))
+            on_response = lambda index, data: stream.set(index, statistic_day_text(data), location_header(data.location))
+        responses = await get_responses(message, urls_statistic, PRIORITY_BULK, on_response)
+        if responses is None:
+            if stream:
+                stream.finish([STREAM_FAILED])
+            return
+        # the days of the longer windows come from the history store, fetched once per location
+        series = await load_series(API_KEY_weather, city, STATS_WINDOWS[-1])
+        windows = series.summarize(STATS_WINDOWS, today - timedelta(days=1))
+        if stream:
+            stream.finish(statistic_report(responses, windows))
+        else:
+            for msg_statistic in statistic_report(responses, windows):
+                sender.send_message(message.chat.id, msg_statistic)
+        loger.info("statistic : Данные успешно обработаны")
 
     except Exception as e:
-        bot.send_message(message.chat.id, f"Произошла ошибка")
+        sender.send_message(message.chat.id, f"Произошла ошибка")
         loger.error(f"statistic : Ошибка при обработке данных {e}")
     except ValidationError as e:
-        bot.send_message(message.chat.id, f"Произошла ошибка")
+        sender.send_message(message.chat.id, f"Произошла ошибка")
         loger.error(f"statistic : Ошибка валидации {e}")
 
 
 @bot.message_handler(commands=['prediction'])
-def prediction(message):
-    loger.info(f"Пользователь запросил prediction: {city}")
-    avgtemp_c_7days = set()
-    for days in range(7):
-        statistic_date = today_date - timedelta(days=days)
-        url_prediction = f'https://api.weatherapi.com/v1/history.json?key={API_KEY_weather}&q={city}&dt={statistic_date}'
-        data = get_response(message, url_prediction, bot)
-        day_details = DayDetails.parse_obj(data['forecast']['forecastday'][0]['day'])
-        avgtemp_c_7days.add(day_details.avgtemp_c)
-    avgtemp_c_7days = round(sum(avgtemp_c_7days) / len(avgtemp_c_7days))
-    avgtemp_c_3days = set()
-    for days in range(3):
-        url_forecast_several = f'http://api.weatherapi.com/v1/forecast.json?key={API_KEY_weather}&q={city}&days=3&aqi=no&alerts=no'
-        try:
-            data = get_response(message, url_forecast_several, bot)
-            weather_data = WeatherData.parse_obj(data)
-            location = weather_data.location
-
-            for day_num in range(1, len(data['forecast']['forecastday'])):
-                forecast_data = ForecastForecastDay.parse_obj(data['forecast']['forecastday'][day_num])
-                avgtemp_c_3days.add(forecast_data.day.avgtemp_c)
-        except Exception as e:
-            bot.send_message(message.chat.id, f"Произошла ошибка {e}")
-            loger.error(f"statistic : Ошибка при обработке данных {e}")
-        except ValidationError as e:
-            bot.send_message(message.chat.id, f"Произошла ошибка")
-            loger.error(f"statistic : Ошибка валидации {e}")
-
-    avgtemp_c_3days = round(sum(avgtemp_c_3days) / len(avgtemp_c_3days))
+@timed('prediction')
+async def prediction(message):
+    city = await chat_city(message.chat.id)
+    loger.info("Пользователь запросил prediction: %s", city)
     try:
-        if avgtemp_c_7days < avgtemp_c_3days:
-            bot.send_message(message.chat.id,
-                             f"Средняя температура в ближайшие 3 дня будет {avgtemp_c_3days}°C, это на {avgtemp_c_3days - avgtemp_c_7days}°C  теплее чем за последнюю неделю")
-        elif avgtemp_c_7days > avgtemp_c_3days:
-            bot.send_message(message.chat.id,
-                             f"Средняя температура в ближайшие 3 дня будет {avgtemp_c_3days} °C, это на  {avgtemp_c_7days - avgtemp_c_3days}°C холоднее чем за последнюю неделю")
-        else:
-            bot.send_message(message.chat.id,
-                             f"Средняя температура в ближайшие 3 дня будет {avgtemp_c_3days}°C, температура сохранилась как в последние 7 дней")
-        loger.info(f"statistic : Данные успешно обработаны")
+        if STREAMING == 'on':
+            await stream_prediction(message, city)
+            return
+        history = asyncio.create_task(load_series(API_KEY_weather, city, 30))
+        try:
+            weather_data = await get_forecast(message, API_KEY_weather, city)
+            if weather_data is None:
+                return
+            series = await history
+        finally:
+            history.cancel()  # nothing if done; else the location failed, its history isn't needed
+        windows = series.summarize((7, 30), date.today() - timedelta(days=1))
+        if windows[7] is None:
+            sender.send_message(message.chat.id, NO_WEEK_DATA)
+            return
+        avgtemp_c_3days = next_days_average(weather_data)
+        avgtemp_c_7days = round(windows[7].mean, 1)
+        text = prediction_report(avgtemp_c_3days, avgtemp_c_7days, windows[30])
+        sender.send_message(message.chat.id, text)
+        loger.info("prediction : Данные успешно обработаны")
 
     except ZeroDivisionError as e:
-        bot.send_message(message.chat.id, f"Произошла ошибка")
-        loger.error(f"statistic : Ошибка при обработке данных {e}")
-
+        sender.send_message(message.chat.id, f"Произошла ошибка")
+        loger.error(f"prediction : Ошибка при обработке данных {e}")
+    except ValidationError as e:
+        sender.send_message(message.chat.id, f"Произошла ошибка")
+        loger.error(f"prediction : Ошибка валидации {e}")
     except Exception as e:
-        loger.error(f"statistic : Ошибка при обработке данных {e}")
+        sender.send_message(message.chat.id, f"Произошла ошибка")
+        loger.error(f"prediction : Ошибка при обработке данных {e}")
+
 
+def next_days_average(weather_data: WeatherData) -> float:
+    next_days = [forecast_data.day.avgtemp_c for forecast_data in weather_data.forecast.forecastday[1:4]]
+    return round(sum(next_days) / len(next_days), 1)
 
-bot.infinity_polling()
+
+async def stream_prediction(message, city: str):
+    """
+        /prediction with STREAMING=on: the forecast (usually cached) is shown while the past month is being loaded.
+        """
+    stream = StreamingMessage(message.chat.id, PREDICTION_LOADING)
+    history = asyncio.create_task(load_series(API_KEY_weather, city, 30))
+    try:
+        weather_data = await get_forecast(message, API_KEY_weather, city)
+        if weather_data is None:
+            stream.finish([STREAM_FAILED])
+            return
+        avgtemp_c_3days = next_days_average(weather_data)
+        stream.finish([prediction_forecast(avgtemp_c_3days)])
+        windows = (await history).summarize((7, 30), date.today() - timedelta(days=1))
+    finally:
+        history.cancel()  # nothing if done; else the location failed, its history isn't needed
+    if windows[7] is None:
+        stream.finish([NO_WEEK_DATA])
+        return
+    stream.finish([prediction_report(avgtemp_c_3days, round(windows[7].mean, 1), windows[30])])
+
+
+async def serve(receive, snapshot: str = SESSIONS_SNAPSHOT, keep=None):
+    """
+        Runs the handlers on the updates brought by receive() until it returns or is cancelled.
+        """
+    if snapshot:
+        sessions.load(*snapshot_paths(SESSIONS_SNAPSHOT), keep=keep)
+    sender.start(bot)
+    prewarmer.start(API_KEY_weather)
+    try:
+        await receive()
+    finally:
+        await prewarmer.stop()
+        await sender.join()
+        await sender.stop()
+        await close_session()
+        await status_server.stop()
+        if snapshot:
+            sessions.save(snapshot)
+
+
+def cancel_on_sigterm():
+    """
+        docker stop sends SIGTERM, which Python doesn't handle: the process was killed without the shutdown
+        of serve() and main() (session snapshot, queued messages, worker processes, log queue).
+        Now SIGTERM cancels the running task like Ctrl+C does.
+        """
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+
+def run_worker(index: int, updates):
+    """
+        A worker process of WORKERS > 1: the chats with shard_of(chat id) == index. Its metrics are served
+        on STATUS_PORT + 1 + index.
+        """
+    async def worker():
+        cancel_on_sigterm()
+        if STATUS_PORT:
+            status_server.port = STATUS_PORT + 1 + index
+            await status_server.start()
+        snapshot = SESSIONS_SNAPSHOT and f'{SESSIONS_SNAPSHOT}.{index}'
+        await serve(lambda: serve_shard(bot, updates), snapshot, keep=lambda chat_id: shard_of(chat_id) == index)
+    try:
+        asyncio.run(worker())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass  # Ctrl+C reaches the whole process group, the ingester stops the workers itself
+
+
+async def main():
+    cancel_on_sigterm()
+    await status_server.start()
+    if STARTUP_CHECKS == 'background':
+        # start serving at once, the result is reported by /ready
+        start_startup_checks(bot, API_KEY_weather)
+    elif not await run_startup_checks(bot, API_KEY_weather):
+        await close_session()
+        await status_server.stop()
+        raise SystemExit(1)
+    if WORKERS > 1:
+        # this process only receives the updates, the handlers run in the worker processes
+        ingester = Ingester(bot, run_worker)
+        try:
+            if BOT_MODE == 'webhook':
+                await run_webhook(bot, ingester)
+            else:
+                await ingester.run()
+        finally:
+            await bot.close_session()
+            await close_session()
+            await status_server.stop()
+    elif BOT_MODE == 'webhook':
+        await serve(lambda: run_webhook(bot))
+    else:
+        await bot.remove_webhook()  # getUpdates doesn't work while a webhook is set
+        await serve(bot.infinity_polling)
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except asyncio.CancelledError:
+        pass  # SIGTERM, everything has been shut down
@@ -0,0 +1,159 @@
+import time
+import bisect
+import functools
+import contextvars
+from contextlib import contextmanager
+from logs import request_context
+
+# Metrics in the Prometheus text format, served by the status server on /metrics.
+# prometheus_client is not a dependency of the bot, the few metric types needed are kept here.
+
+# command of the handler the current task works for, it labels the upstream requests and Telegram sends
+current_command = contextvars.ContextVar('current_command', default=None)
+
+
+def command_label() -> str:
+    return current_command.get() or 'other'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PARSE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}  # name -> metric, in the order of registration
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """
+        Monotonic counter. func - callable returning the value, for counts another object already keeps.
+        """
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), func=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.func = func
+        self._values = {}  # label values -> value
+        registry.register(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> list:
+        if self.func is not None:
+            return [f'{self.name} {self.func()}']
+        return [f'{self.name}{_labels(self.labels, values)} {value}' for values, value in self._values.items()]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    @contextmanager
+    def track(self, *label_values):
+        """
+            Counts what is in progress inside the with block.
+            """
+        self.inc(*label_values)
+        try:
+            yield
+        finally:
+            self.dec(*label_values)
+
+
+class Histogram:
+    """
+        Observations counted in buckets with upper bounds buckets (seconds for all the histograms of the bot).
+        """
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [count of each bucket and +Inf, sum]
+        registry.register(self)
+
+    def observe(self, value: float, *label_values):
+        counts = self._values.get(label_values)
+        if counts is None:
+            counts = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def samples(self) -> list:
+        lines = []
+        for values, counts in self._values.items():
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, values, le)} {total}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {counts[-1]}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {total}')
+        return lines
+
+
+handler_seconds = Histogram('bot_handler_seconds', 'Time to handle a message, by command', ('command',))
+handlers_in_progress = Gauge('bot_handlers_in_progress', 'Messages being handled, by command', ('command',))
+
+
+def timed(command: str):
+    """
+        Decorator of a message handler: times it and labels everything it does with command.
+        A handler called from another one (add_city -> weather) is counted as part of the outer command.
+        """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(message, *args, **kwargs):
+            if current_command.get() is not None:
+                return await func(message, *args, **kwargs)
+            token = current_command.set(command)
+            try:
+                with (handlers_in_progress.track(command), handler_seconds.time(command),
+                      request_context(message.chat.id, command)):
+                    return await func(message, *args, **kwargs)
+            finally:
+                current_command.reset(token)
+        return wrapper
+    return decorator
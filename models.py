@@ -1,53 +1,47 @@
-from pydantic import BaseModel, conlist
-from typing import List
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
+
+# Only the fields the bot shows are declared, the rest of the weatherapi.com payload is skipped while parsing.
+# Parsed responses are cached and shared between chats, so the models are frozen.
 
 
 class Condition(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     text: str
     icon: str
     code: int
 
 
 class DayDetails(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     maxtemp_c: float
-    maxtemp_f: float
     mintemp_c: float
-    mintemp_f: float
     avgtemp_c: float
-    avgtemp_f: float
-    maxwind_mph: float
     maxwind_kph: float
-    totalprecip_mm: float
-    totalprecip_in: float
-    totalsnow_cm: float
-    avgvis_km: float
-    avgvis_miles: float
     avghumidity: int
-    daily_will_it_rain: int
     daily_chance_of_rain: int
-    daily_will_it_snow: int
     daily_chance_of_snow: int
-    condition: dict
-    uv: float
+    condition: Condition
 
 
 class Location(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     name: str
     region: str
     country: str
     lat: float
     lon: float
-    tz_id: str
-    localtime_epoch: int
     localtime: str
 
 
 class Current(BaseModel):
-    last_updated: str
+    model_config = ConfigDict(frozen=True)
+
     temp_c: float
-    temp_f: float
-    is_day: int
-    condition: dict
+    condition: Condition
     wind_kph: float
     wind_dir: str
     feelslike_c: float
@@ -55,28 +49,38 @@ class Current(BaseModel):
 
 
 class ForecastForecastDay(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     date: str
-    date_epoch: int
     day: DayDetails
 
 
-class WeatherData(BaseModel):
-    location: Location
-    current: Current
-    forecast: dict
+class Forecast(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    forecastday: List[ForecastForecastDay]
 
 
-class Locations(BaseModel):
+class SearchLocation(BaseModel):
+    """
+        search.json result, id is used as the q of the other requests: q=id:<id>.
+        """
+    model_config = ConfigDict(frozen=True)
+
+    id: int
     name: str
     region: str
     country: str
     lat: float
     lon: float
-    tz_id: str
-    localtime_epoch: int
-    localtime: str
 
 
-class StatisticsWeather(BaseModel):
-    Location: Locations
-    forecast: dict
+class WeatherData(BaseModel):
+    """
+        forecast.json, history.json (without current) and current.json (without forecast) responses.
+        """
+    model_config = ConfigDict(frozen=True)
+
+    location: Location
+    current: Optional[Current] = None
+    forecast: Optional[Forecast] = None
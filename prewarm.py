@@ -0,0 +1,83 @@
+import time
+import asyncio
+import logging
+from datetime import date, timedelta
+from config import WEATHER_API_URL, PREWARM_TOP_K, PREWARM_INTERVAL
+from cache import response_cache, location_popularity, cache_key
+from helpers import fetch, refresh
+from storage import shared_cache
+from forecasts import forecast_url
+from ratelimit import PRIORITY_BACKGROUND
+from metrics import Counter, Gauge
+
+prewarm_requests = Counter('weather_prewarm_requests_total', 'Background renewals by result: renewed, fresh, failed',
+                           ('result',))
+
+
+class Prewarmer:
+    """
+        Keeps the forecast of the top_k most requested locations in the cache: every location is renewed
+        once per interval, before the cached forecast expires, and yesterday's history is put in the history store.
+        The renewals are spread evenly over the interval and wait behind the users' requests in api_limiter,
+        so they never come as a burst.
+        """
+
+    def __init__(self, top_k: int = PREWARM_TOP_K, interval: float = PREWARM_INTERVAL):
+        self.top_k = top_k
+        self.interval = interval
+        self.api_key = None
+        self.locations = []  # locations of the current round
+        self._task = None
+
+    def start(self, api_key: str):
+        if not self.top_k:
+            return
+        self.api_key = api_key
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run(self):
+        while True:
+            self.locations = location_popularity.top(self.top_k)
+            location_popularity.decay()
+            if not self.locations:
+                await asyncio.sleep(self.interval)
+                continue
+            pause = self.interval / len(self.locations)
+            for location in self.locations:
+                started = time.monotonic()
+                await self.warm(location)
+                await asyncio.sleep(max(0.0, pause - (time.monotonic() - started)))
+
+    async def warm(self, location: str):
+        url_forecast = forecast_url(self.api_key, location)
+        url_history = (f'{WEATHER_API_URL}/history.json?key={self.api_key}&q={location}'
+                       f'&dt={date.today() - timedelta(days=1)}&hour=12')
+        # a past day is taken from the history store if it's there already
+        requests = [fetch(url_history, PRIORITY_BACKGROUND)]
+        key = cache_key(url_forecast)
+        next_round = time.monotonic() + self.interval
+        expires = response_cache.expires(key)
+        if expires is not None and expires <= next_round and shared_cache is not None:
+            # another worker may have renewed it, its expiry is wall clock time
+            shared = shared_cache.expires(key)
+            expires = None if shared is None else max(expires, shared - time.time() + time.monotonic())
+        if expires is None or expires > next_round:
+            prewarm_requests.inc('fresh')  # still fresh at the next round, a user request has renewed it
+        else:
+            requests.append(refresh(url_forecast))
+        for result in await asyncio.gather(*requests, return_exceptions=True):
+            if isinstance(result, Exception) or result[0] != 200:
+                prewarm_requests.inc('failed')
+                logging.warning(f"Prewarm {location}: {result!r}")
+            else:
+                prewarm_requests.inc('renewed')
+
+
+prewarmer = Prewarmer()
+Gauge('weather_prewarm_locations', 'Locations kept warm in the current round', func=lambda: len(prewarmer.locations))
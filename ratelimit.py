@@ -0,0 +1,97 @@
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from config import WEATHER_API_RATE, WEATHER_API_BURST, RETRY_BASE_DELAY, RETRY_MAX_DELAY, WORKERS
+
+# lower goes first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_BACKGROUND = 2
+
+
+class TokenBucket:
+    """
+        rate tokens per second, at most burst of them saved up.
+        """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """
+            Seconds until a token is available, 0 if there is one now.
+            """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class PriorityLimiter:
+    """
+        Hands out the tokens of a TokenBucket to waiting requests, lower priority value first,
+        in arrival order within a priority.
+        """
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self._waiters = []  # heap of (priority, arrival number, future)
+        self._arrivals = itertools.count()
+        self._dispatcher = None
+
+    def __len__(self):
+        return len(self._waiters)
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        if not self._waiters and self.bucket.delay() == 0:
+            self.bucket.take()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.cancelled():
+                heapq.heappop(self._waiters)
+                continue
+            delay = self.bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            heapq.heappop(self._waiters)
+            self.bucket.take()
+            future.set_result(None)
+
+
+def is_transient(status: int, data) -> bool:
+    """
+        Errors worth another attempt: rate limited, server errors and weatherapi 9999 (internal application error).
+        """
+    if status == 429 or status >= 500:
+        return True
+    return status == 400 and isinstance(data, dict) and data.get('error', {}).get('code') == 9999
+
+
+def backoff_delay(attempt: int, retry_after: float = None) -> float:
+    """
+        Exponential backoff with jitter, so retries of requests that failed together don't come back together.
+        Retry-After is followed up to RETRY_MAX_DELAY, a handler is never held for longer.
+        """
+    if retry_after:
+        return min(retry_after, RETRY_MAX_DELAY)
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1)
+
+
+api_limiter = PriorityLimiter(TokenBucket(WEATHER_API_RATE / WORKERS, max(WEATHER_API_BURST // WORKERS, 1)))
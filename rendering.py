@@ -0,0 +1,306 @@
+import logging
+from html import escape
+from models import Location, Current, Condition, ForecastForecastDay
+
+MESSAGE_LIMIT = 4096  # max length of a Telegram message
+
+# All the text the handlers send is built here. The lookup tables and the fixed messages are made once at import,
+# the per-message work is the f-strings below (bench/format_bench.py).
+
+WIND_DIRECTIONS = {
+    'N': "Северный",
+    'NNE': "Северо-северо-восточный",
+    'NE': "Северо восточный",
+    'ENE': "Восточно-северо-восточный",
+    'E': "Восточный",
+    'ESE': "Восточно-юго-восточный",
+    'SE': "Северный юго-восточный",
+    'SSE': "Юго-юго-восточный",
+    'S': "Южный",
+    'SSW': "Юго-юго-западный",
+    'SW': "Юго западный",
+    'WSW': "Западно-юго-западный",
+    'W': "Западный",
+    'WNW': "Западно-северо-западный",
+    'NW': "Северный западный",
+    'NNW': "Северо-северо-западный",
+}
+_WIND_PREFIXES = {code: f"Ветер {name} " for code, name in WIND_DIRECTIONS.items()}
+
+# weatherapi.com condition codes (https://www.weatherapi.com/docs/weather_conditions.json): code, text, translation
+CONDITIONS = (
+    (1000, "Sunny", "Солнечно"),
+    (1003, "Partly cloudy", "Переменная облачность"),
+    (1006, "Cloudy", "Облачно"),
+    (1009, "Overcast", "Пасмурная погода"),
+    (1030, "Mist", "Туман"),
+    (1063, "Patchy rain possible", "Возможен кратковременный дождь"),
+    (1066, "Patchy snow possible", "Возможен кратковременный снег"),
+    (1069, "Patchy sleet possible", "Возможен кратковременный мокрый снег"),
+    (1072, "Patchy freezing drizzle possible", "Возможен кратковременный ледяной дождь"),
+    (1087, "Thundery outbreaks possible", "Возможны грозовые вспышки"),
+    (1114, "Blowing snow", "Низовая метель"),
+    (1117, "Blizzard", "Метель"),
+    (1135, "Fog", "Туман"),
+    (1147, "Freezing fog", "Ледяной туман"),
+    (1150, "Patchy light drizzle", "Небольшой мелкий дождь"),
+    (1153, "Light drizzle", "Легкая морось"),
+    (1168, "Freezing drizzle", "Изморозь"),
+    (1171, "Heavy freezing drizzle", "Сильный ледяной дождь"),
+    (1180, "Patchy light rain", "Небольшой дождь"),
+    (1183, "Light rain", "Легкий дождь"),
+    (1186, "Moderate rain at times", "Временами умеренный дождь"),
+    (1189, "Moderate rain", "Умеренный дождь"),
+    (1192, "Heavy rain at times", "Временами сильный дождь"),
+    (1195, "Heavy rain", "Ливень"),
+    (1198, "Light freezing rain", "Легкий ледяной дождь"),
+    (1201, "Moderate or heavy freezing rain", "Умеренный или сильный ледяной дождь"),
+    (1204, "Light sleet", "Легкий мокрый снег"),
+    (1207, "Moderate or heavy sleet", "Умеренный или сильный мокрый снег"),
+    (1210, "Patchy light snow", "Небольшой мелкий снег"),
+    (1213, "Light snow", "Легкий снег"),
+    (1216, "Patchy moderate snow", "Неровный умеренный снег"),
+    (1219, "Moderate snow", "Умеренный снег"),
+    (1222, "Patchy heavy snow", "Неровный сильный снег"),
+    (1225, "Heavy snow", "Сильный снегопад"),
+    (1237, "Ice pellets", "Ледяная крупа"),
+    (1240, "Light rain shower", "Небольшой дождь моросит"),
+    (1243, "Moderate or heavy rain shower", "Умеренный или сильный ливень"),
+    (1246, "Torrential rain shower", "Проливной ливень"),
+    (1249, "Light sleet showers", "Небольшой ливень с мокрым снегом"),
+    (1252, "Moderate or heavy sleet showers", "Умеренный или сильный ливень с мокрым снегом"),
+    (1255, "Light snow showers", "Легкий снегопад"),
+    (1258, "Moderate or heavy snow showers", "Умеренный или сильный снегопад"),
+    (1261, "Light showers of ice pellets", "Легкий дождь ледяных крупинок"),
+    (1264, "Moderate or heavy showers of ice pellets", "Умеренные или сильные ливни ледяной крупы"),
+    (1273, "Patchy light rain with thunder", "Небольшой дождь с грозой"),
+    (1276, "Moderate or heavy rain with thunder", "Умеренный или сильный дождь с грозой"),
+    (1279, "Patchy light snow with thunder", "Небольшой снег с грозой"),
+    (1282, "Moderate or heavy snow with thunder", "Умеренный или сильный снег с грозой"),
+)
+CONDITIONS_BY_CODE = {code: translation for code, _, translation in CONDITIONS}
+# for codes missing above; weatherapi.com changes the texts ("Patchy rain nearby") and their case, not the codes
+CONDITIONS_BY_TEXT = {text.lower(): translation for _, text, translation in CONDITIONS}
+_unknown_conditions = set()
+
+START_MESSAGE = (
+    'Привет! Я - WeatherForecastBot, твой личный помощник для получения точного прогноза погоды.'
+    ' Я могу предоставить тебе информацию о погоде в любом городе. Просто напиши мне название '
+    'города или поделитесь местоположением, и я скажу тебе, что тебя ждет! Начнем?'
+    'Вот команды, которые я знаю: \n'
+    '/help - помощь\n'
+    '/change_city - изменение города\n'
+    '/current_weather - текущая погода\n'
+    '/weather_forecast - прогноз погоды на нужную дату\n'
+    '/forecast_for_several_days - прогноз погоды на несколько дней (от 2 до 10)\n'
+    '/weather_statistics - статистика погоды за последние 7 дней\n'
+    '/prediction - предсказание средней температуры на 3 дня\n'
+    'или просто нажмите меню для отображения всех команд \n')
+HELP_MESSAGE = '\n'.join(f'/{command} - {description}' for command, description in (
+    ('help', 'помощь'),
+    ('change_city', 'изменить город'),
+    ('current_weather', 'погода сегодня'),
+    ('weather_forecast', 'погода на нужную дату'),
+    ('forecast_for_several_days', 'погода на несколько дней'),
+    ('weather_statistic', 'статистика за послдение 7 дней'),
+    ('prediction', 'предсказание на 3 дня'),
+))
+ASK_CITY = "Введите название города:"
+ASK_DAYS = 'В данном разделе можно получить прогноз погоды на несколько дней.\n Введите количество дней(от 1 до 10):'
+BAD_DAYS = 'Количество дней должно быть от 1 до 10'
+BAD_NUMBER = 'Неверный формат ввода'
+BAD_DATE = "Неверный формат даты. Введите дату в формате ГГГГ-ММ-ДД"
+NO_WEEK_DATA = "Нет данных о погоде за последнюю неделю"
+# streamed replies (STREAMING=on): the placeholder sent at once, then edited
+STATISTIC_LOADING = "Собираю статистику…"
+PREDICTION_LOADING = "Считаю среднюю температуру…"
+STREAM_FAILED = "Данные недоступны"
+
+
+def wind(win_dir: str, wind_kph: float, max_wind_kph: float) -> str:
+    """
+        Wind direction in Russian, the speed and the gusts of the day converted from km/h to m/s.
+        """
+    prefix = _WIND_PREFIXES.get(win_dir)
+    if prefix is None:
+        logging.debug("Wind direction is unknown.")
+        return "Направление ветра неизвестно"
+    return f"{prefix}{round(wind_kph / 3.6)}м/с (с порывами до {round(max_wind_kph / 3.6)} м/с)"
+
+
+def weather_condition(condition: Condition) -> str:
+    """
+        Russian text of a weatherapi.com condition, the English text if it is not known
+        (reported once per code).
+        """
+    translation = CONDITIONS_BY_CODE.get(condition.code) or CONDITIONS_BY_TEXT.get(condition.text.strip().lower())
+    if translation is None:
+        if condition.code not in _unknown_conditions:
+            _unknown_conditions.add(condition.code)
+            logging.warning(f"Unknown condition: {condition.code} {condition.text}")
+        return condition.text
+    return translation
+
+
+def split_message(parts: list, limit: int = MESSAGE_LIMIT, separator: str = '\n') -> list:
+    """
+        Joins parts into as few messages as fit into limit, a part is never split between two messages.
+        """
+    messages = []
+    current = ''
+    for part in parts:
+        if current and len(current) + len(separator) + len(part) > limit:
+            messages.append(current)
+            current = part
+        else:
+            current = f'{current}{separator}{part}' if current else part
+    if current:
+        messages.append(current)
+    return messages
+
+
+def ask_date(first, last) -> str:
+    return f'Введите дату в формате ГГГГ-ММ-ДД в диапозоне от {first} до {last}:'
+
+
+def date_too_far(last) -> str:
+    return f'Введенная дата должна быть не дальше {last}.'
+
+
+def forecast_unavailable(day) -> str:
+    return f"Прогноз на {day} недоступен"
+
+
+def current_report(location: Location, current_weather: Current, today: ForecastForecastDay) -> str:
+    """
+        /current_weather, also sent after the city is changed.
+        """
+    day = today.day
+    return (
+        f"{location.name} ({location.region}): {location.localtime}\n"
+        f"Температура: {current_weather.temp_c}°C (ощущается как {current_weather.feelslike_c}°C)\n"
+        f"Максимальная температура: {day.maxtemp_c}°C\n"
+        f"Минимальная температура: {day.mintemp_c}°C\n"
+        f"{wind(current_weather.wind_dir, current_weather.wind_kph, day.maxwind_kph)}\n"
+        f"Влажность {current_weather.humidity}% \n"
+        f"Веротность осадков: {day.daily_chance_of_rain if current_weather.temp_c > 0 else day.daily_chance_of_snow}%\n"
+        f"{weather_condition(day.condition)}")
+
+
+def date_report(location: Location, current_weather: Current, forecast_data: ForecastForecastDay) -> str:
+    """
+        /weather_forecast: the forecast of one day.
+        """
+    day = forecast_data.day
+    return (
+        f"Предоставлен прогноз на {forecast_data.date}\n"
+        f"{location.name} ({location.region}):\n"
+        f"Максимальная температура: {day.maxtemp_c}°C\n"
+        f"Минимальная температура: {day.mintemp_c}°C\n"
+        f"{wind(current_weather.wind_dir, current_weather.wind_kph, day.maxwind_kph)}\n"
+        f"Влажность {day.avghumidity}% \n"
+        f"Веротность осадков: {day.daily_chance_of_rain if day.avgtemp_c > 0 else day.daily_chance_of_snow}%\n"
+        f"{weather_condition(day.condition)}")
+
+
+def forecast_day_text(forecast_data: ForecastForecastDay, current_weather: Current) -> str:
+    day = forecast_data.day
+    return (
+        f"Прогноз на {forecast_data.date}\n"
+        f"Максимальная температура: {day.maxtemp_c}°C\n"
+        f"Минимальная температура: {day.mintemp_c}°C\n"
+        f"{wind(current_weather.wind_dir, current_weather.wind_kph, day.maxwind_kph)}\n"
+        f"Влажность {day.avghumidity}% \n"
+        f"Вероятность осадков: {day.daily_chance_of_rain if day.avgtemp_c > 0 else day.daily_chance_of_snow}%\n"
+        f"{weather_condition(day.condition)}\n")
+
+
+def forecast_table(location: Location, days: list) -> str:
+    """
+        Compact multi-day forecast, one row per day in a monospace block (parse_mode HTML).
+        """
+    rows = [f"{'Дата':<10} {'Мин':>5} {'Макс':>5} {'Осад':>4}"]
+    for forecast_data in days:
+        day = forecast_data.day
+        chance = day.daily_chance_of_rain if day.avgtemp_c > 0 else day.daily_chance_of_snow
+        rows.append(f"{forecast_data.date:<10} {day.mintemp_c:>5.0f} {day.maxtemp_c:>5.0f} {chance:>3}%")
+        rows.append(f"  {weather_condition(day.condition)}")
+    return f"<b>{escape(location.name)} ({escape(location.region)})</b>\n<pre>{escape(chr(10).join(rows))}</pre>"
+
+
+def forecast_report(location: Location, current_weather: Current, days: list, table: bool = False) -> list:
+    """
+        Multi-day forecast as the list of messages to send: one message unless it exceeds the Telegram limit.
+        """
+    if table:
+        return [forecast_table(location, days)]
+    header = f"{location.name} ({location.region}):\n"
+    return split_message([header] + [forecast_day_text(forecast_data, current_weather) for forecast_data in days])
+
+
+def statistic_summary(windows: dict) -> str:
+    """
+        Mean, extremes and trend of the average temperature over each window of stats.DailySeries.summarize.
+        """
+    lines = ["Итоги:"]
+    for days, stats in windows.items():
+        if stats is None:
+            continue
+        coverage = f" (есть данные за {stats.count})" if stats.count < days else ''
+        lines.append(f"{days} дней{coverage}: средняя {stats.mean:.1f}°C ±{stats.std:.1f}, "
+                     f"Min: {stats.low}°C, Max: {stats.high}°C, тренд {stats.trend * 7:+.1f}°C в неделю")
+    return '\n'.join(lines) if len(lines) > 1 else ''
+
+
+def location_header(location: Location) -> str:
+    return f"{location.name} ({location.region}):\n"
+
+
+def statistic_day_text(weather_data) -> str:
+    """
+        /weather_statistic: the line of one history.json response.
+        """
+    forecast_data = weather_data.forecast.forecastday[0]
+    day = forecast_data.day
+    return (f"{forecast_data.date}\n"
+            f"Температура: Max: {day.maxtemp_c}°C, Min: {day.mintemp_c}°C, "
+            f"{weather_condition(day.condition)} \n")
+
+
+def statistic_report(weather_data_days: list, windows: dict = None) -> list:
+    """
+        /weather_statistic: one line per history.json response, under a single location header,
+        then the summary of the longer windows if there is one.
+        """
+    parts = [location_header(weather_data_days[0].location)]
+    parts.extend(statistic_day_text(weather_data) for weather_data in weather_data_days)
+    summary = statistic_summary(windows or {})
+    if summary:
+        parts.append(summary)
+    return split_message(parts)
+
+
+def prediction_forecast(next_days: float) -> str:
+    """
+        /prediction streamed: the forecast part, shown while the past days are still being loaded.
+        """
+    return f"Средняя температура в ближайшие 3 дня будет {next_days}°C\nСравниваю с последней неделей…"
+
+
+def prediction_report(next_days: float, last_week: float, month=None) -> str:
+    """
+        /prediction: mean temperature of the next 3 days against the last 7 days, both rounded to 0.1°C,
+        and against the 30-day mean if month (stats.WindowStats) has more days than the week.
+        """
+    difference = round(next_days - last_week, 1)
+    if difference > 0:
+        text = (f"Средняя температура в ближайшие 3 дня будет {next_days}°C, "
+                f"это на {difference}°C теплее чем за последнюю неделю")
+    elif difference < 0:
+        text = (f"Средняя температура в ближайшие 3 дня будет {next_days}°C, "
+                f"это на {-difference}°C холоднее чем за последнюю неделю")
+    else:
+        text = f"Средняя температура в ближайшие 3 дня будет {next_days}°C, температура сохранилась как в последние 7 дней"
+    if month is not None and month.count > 7:
+        text += f"\nОтклонение от средней за 30 дней ({month.mean:.1f}°C): {month.anomaly(next_days):+.1f}°C"
+    return text
@@ -0,0 +1,149 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import deque
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+from ratelimit import TokenBucket
+from metrics import Counter, Gauge, Histogram, command_label
+from config import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_INTERVAL, SENDER_WORKERS, WORKERS
+
+queue_seconds = Histogram('telegram_queue_seconds', 'Time a Telegram request waited in the send queue, by command',
+                          ('command',))
+send_seconds = Histogram('telegram_send_seconds', 'Telegram request time, by command and method', ('command', 'method'))
+send_errors = Counter('telegram_errors_total', 'Failed Telegram requests by error code, 429 included', ('code',))
+
+
+class MessageSender:
+    """
+        Queue of outgoing Telegram requests delivered by a small pool of workers.
+        Requests of one chat go out in order and at most one per chat_interval seconds, all chats together
+        at most global_rate per second. A 429 answer puts the request back and the chat waits retry_after seconds.
+        Handlers only enqueue and go on; the returned future gives the result to those who need it.
+        """
+
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE / WORKERS, chat_interval: float = TELEGRAM_CHAT_INTERVAL,
+                 workers: int = SENDER_WORKERS):
+        self.bucket = TokenBucket(global_rate, 1)  # no burst: Telegram counts messages per second
+        self.chat_interval = chat_interval
+        self.workers = workers
+        self.bot = None
+        self._queues = {}  # chat id -> deque of requests not sent yet
+        self._ready = []  # heap of (time the chat may send, order, chat id), one entry per chat with a queue
+        self._next_send = {}  # chat id -> earliest time of the next request to the chat
+        self._order = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._busy = 0
+        self._tasks = []
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def start(self, bot: AsyncTeleBot):
+        self.bot = bot
+        self._tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def join(self):
+        """
+            Waits until everything enqueued has been sent.
+            """
+        while self._queues or self._busy:
+            await asyncio.sleep(0.01)
+
+    def enqueue(self, chat_id: int, method: str, *args, **kwargs) -> asyncio.Future:
+        """
+            Schedules bot.<method>(*args, **kwargs) for chat_id.
+            """
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+            self._schedule(chat_id)
+        # the command is taken here, the request is sent later by a worker outside the handler
+        queue.append((method, args, kwargs, future, command_label(), time.monotonic()))
+        return future
+
+    def send_message(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        return self.enqueue(chat_id, 'send_message', chat_id, text, **kwargs)
+
+    def _schedule(self, chat_id: int):
+        heapq.heappush(self._ready, (self._next_send.get(chat_id, 0), next(self._order), chat_id))
+        self._wakeup.set()
+
+    async def worker(self):
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._ready[0][0] - time.monotonic()
+            if delay > 0:
+                # sleep until the chat may send, or until a new chat is scheduled
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            chat_id = heapq.heappop(self._ready)[2]
+            self._busy += 1
+            try:
+                await self._send_next(chat_id)
+            finally:
+                self._busy -= 1
+
+    async def _send_next(self, chat_id: int):
+        while (delay := self.bucket.delay()) > 0:
+            await asyncio.sleep(delay)
+        self.bucket.take()
+        queue = self._queues[chat_id]
+        request = queue.popleft()
+        method, args, kwargs, future, command, enqueued = request
+        start = time.monotonic()
+        queue_seconds.observe(start - enqueued, command)
+        next_send = start + self.chat_interval
+        try:
+            with send_seconds.time(command, method):
+                result = await getattr(self.bot, method)(*args, **kwargs)
+            if not future.done():
+                future.set_result(result)
+        except ApiTelegramException as e:
+            send_errors.inc(e.error_code)
+            if e.error_code == 429:
+                retry_after = e.result_json.get('parameters', {}).get('retry_after', 1)
+                logging.warning(f"Telegram 429 for chat {chat_id}, retry after {retry_after}s")
+                queue.appendleft(request)
+                next_send = time.monotonic() + retry_after
+            else:
+                self._fail(future, chat_id, method, e)
+        except Exception as e:
+            send_errors.inc(None)
+            self._fail(future, chat_id, method, e)
+        self._next_send[chat_id] = next_send
+        if queue:
+            self._schedule(chat_id)
+        else:
+            del self._queues[chat_id]
+            if len(self._next_send) > 10000:
+                now = time.monotonic()
+                self._next_send = {chat: at for chat, at in self._next_send.items() if at > now}
+
+    @staticmethod
+    def _fail(future: asyncio.Future, chat_id: int, method: str, error: Exception):
+        logging.error(f"Telegram {method} to chat {chat_id} failed: {error}")
+        if future.done():
+            return
+        future.set_exception(error)
+        future.exception()  # already logged, don't let asyncio report it again if nobody awaits the future
+
+
+sender = MessageSender()
+Gauge('telegram_queue_size', 'Telegram requests waiting in the send queue', func=lambda: len(sender))
@@ -0,0 +1,103 @@
+import os
+import glob
+import json
+import time
+import logging
+from collections import OrderedDict
+from config import DEFAULT_CITY, SESSION_IDLE_TTL, SESSIONS_SNAPSHOT
+
+
+class ChatSession:
+    """
+        State of one chat: chosen location, the handler waiting for the next message and the chosen forecast day.
+        """
+    __slots__ = ('city', 'coords', 'step', 'forecast_day', 'last_seen')
+
+    def __init__(self, city: str = DEFAULT_CITY, coords: tuple = None, last_seen: float = None):
+        self.city = city  # weatherapi.com q: "id:<location id>", or the city name or "lat,lon" if it wasn't found
+        self.coords = coords  # (lat, lon) if the location was shared
+        self.step = None
+        self.forecast_day = None  # date asked for with /weather_forecast
+        self.last_seen = last_seen or time.time()
+
+
+class SessionStore:
+    """
+        Sessions by chat id, ordered from the least to the most recently active.
+        Chats idle for longer than idle_ttl are dropped, so memory depends on the number of active chats only.
+        """
+
+    def __init__(self, idle_ttl: int):
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, chat_id: int) -> ChatSession:
+        now = time.time()
+        self.evict_idle(now)
+        session = self._sessions.get(chat_id)
+        if session is None:
+            session = self._sessions[chat_id] = ChatSession(last_seen=now)
+        else:
+            session.last_seen = now
+            self._sessions.move_to_end(chat_id)
+        return session
+
+    def peek(self, chat_id: int):
+        """
+            Returns the session without creating or touching it.
+            """
+        return self._sessions.get(chat_id)
+
+    def evict_idle(self, now: float = None):
+        expired = (now or time.time()) - self.idle_ttl
+        while self._sessions:
+            chat_id, session = next(iter(self._sessions.items()))
+            if session.last_seen > expired:
+                break
+            del self._sessions[chat_id]
+
+    def save(self, path: str):
+        """
+            Writes chosen locations to path. Pending steps are not saved, the user is asked again after a restart.
+            """
+        snapshot = {chat_id: [session.city, session.coords, session.last_seen]
+                    for chat_id, session in self._sessions.items()}
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(snapshot, file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logging.info(f"Sessions saved: {len(snapshot)}")
+
+    def load(self, *paths: str, keep=None):
+        """
+            Reads the snapshots written by save, the latest session of a chat wins.
+            keep(chat_id) - whether the chat belongs to this process, all chats if None.
+            """
+        snapshot = {}
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as file:
+                for chat_id, session in json.load(file).items():
+                    chat_id = int(chat_id)
+                    if (keep is None or keep(chat_id)) and (chat_id not in snapshot or
+                                                            snapshot[chat_id][2] < session[2]):
+                        snapshot[chat_id] = session
+        for chat_id, (city, coords, last_seen) in sorted(snapshot.items(), key=lambda item: item[1][2]):
+            self._sessions[chat_id] = ChatSession(city, tuple(coords) if coords else None, last_seen)
+        self.evict_idle()
+        logging.info(f"Sessions loaded: {len(self._sessions)}")
+
+
+def snapshot_paths(path: str) -> list:
+    """
+        The snapshot of the single process bot and those of the workers (path.0, path.1, ...), so that chats
+        keep their locations when the number of workers changes.
+        """
+    return [path] + sorted(glob.glob(f'{glob.escape(path)}.[0-9]*'))
+
+
+sessions = SessionStore(SESSION_IDLE_TTL)
@@ -0,0 +1,162 @@
+import json
+import asyncio
+import logging
+import multiprocessing
+from queue import Full
+from aiohttp import web
+from telebot import asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+from webhook import WebhookServer
+from metrics import Counter
+from config import WORKERS, WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE
+
+POLL_TIMEOUT = 20  # seconds of getUpdates long polling
+
+routed_updates = Counter('shard_updates_total', 'Updates handed to the worker processes, by worker', ('worker',))
+
+
+def shard_of(chat_id: int, workers: int = WORKERS) -> int:
+    return chat_id % workers
+
+
+def update_chat_id(update: dict) -> int:
+    """
+        Chat of a raw update: the chat of its message, the user for updates without one (inline queries and such).
+        All updates of a chat go to one worker, so its next step handlers and session stay in that process.
+        """
+    for value in update.values():
+        if isinstance(value, dict):
+            chat = value.get('chat') or (value.get('message') or {}).get('chat') or value.get('from')
+            if chat:
+                return chat['id']
+    return 0
+
+
+class Ingester:
+    """
+        Receives the updates (getUpdates or webhook) in one process and hands the raw JSON to `workers`
+        processes by chat id. The update is parsed and handled in the worker only, so parsing, validation
+        and formatting run on as many cores as there are workers.
+        worker(index, updates) is the function a worker process runs, updates - its multiprocessing queue,
+        None in it means stop.
+        """
+
+    def __init__(self, bot: AsyncTeleBot, worker, workers: int = WORKERS, queue_size: int = WEBHOOK_QUEUE_SIZE):
+        self.bot = bot
+        context = multiprocessing.get_context('spawn')  # a fresh interpreter: no event loop or sockets inherited
+        self.queues = [context.Queue(queue_size) for _ in range(workers)]
+        self.processes = [context.Process(target=worker, args=(index, queue), name=f'worker-{index}')
+                          for index, queue in enumerate(self.queues)]
+        self._runner = None
+        self._watch = None
+
+    def dispatch(self, update: dict, data: str) -> bool:
+        """
+            Puts data, the JSON of update, into the queue of its worker. False if the queue is full.
+            """
+        index = shard_of(update_chat_id(update), len(self.queues))
+        try:
+            self.queues[index].put_nowait(data)
+        except Full:
+            return False
+        routed_updates.inc(index)
+        return True
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        data = (await request.read()).decode()
+        if not self.dispatch(json.loads(data), data):
+            logging.warning("Webhook: очередь обновлений заполнена")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def poll(self):
+        """
+            getUpdates long polling. A full queue holds the update back (and all the following ones, to keep
+            their order) until the worker catches up.
+            """
+        await self.bot.remove_webhook()  # getUpdates doesn't work while a webhook is set
+        offset = None
+        while True:
+            try:
+                updates = await asyncio_helper.get_updates(self.bot.token, offset, 100, POLL_TIMEOUT,
+                                                           request_timeout=POLL_TIMEOUT + 10)
+            except Exception as e:
+                logging.error(f"getUpdates: {e!r}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                data = json.dumps(update, ensure_ascii=False)
+                while not self.dispatch(update, data):
+                    await asyncio.sleep(0.05)
+                offset = update['update_id'] + 1
+
+    async def watch(self):
+        """
+            A worker that died takes its chats with it, the whole bot exits so that it is restarted.
+            """
+        while True:
+            await asyncio.sleep(1)
+            for process in self.processes:
+                if not process.is_alive():
+                    logging.critical(f"{process.name} exited with code {process.exitcode}")
+                    raise SystemExit(1)
+
+    async def start(self, port: int = WEBHOOK_PORT):
+        """
+            Starts the workers, and the webhook server on port unless it is 0 (polling).
+            """
+        for process in self.processes:
+            process.start()
+        self._watch = asyncio.create_task(self.watch())
+        if port:
+            app = web.Application()
+            app.router.add_post(WEBHOOK_PATH, self.handle_update)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, port=port).start()
+            logging.info(f"Webhook server started on port {port}")
+        logging.info(f"Worker processes started: {len(self.processes)}")
+
+    async def run(self):
+        """
+            Polls until cancelled or a worker dies.
+            """
+        await self.start(port=0)
+        try:
+            await asyncio.gather(self.poll(), self._watch)
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._watch is not None:
+            self._watch.cancel()
+        loop = asyncio.get_running_loop()
+        for queue, process in zip(self.queues, self.processes):
+            if process.is_alive():
+                await loop.run_in_executor(None, queue.put, None)  # after the updates already queued
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join)
+
+
+async def serve_shard(bot: AsyncTeleBot, updates):
+    """
+        Worker side: takes the updates of its chats from the ingester's queue and handles them with
+        a WebhookServer pool until None comes.
+        """
+    server = WebhookServer(bot)
+    await server.start(port=0)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await server.queue.put(types.Update.de_json(data))
+        await server.queue.join()
+    finally:
+        await server.stop()
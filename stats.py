@@ -0,0 +1,160 @@
+import math
+import asyncio
+import logging
+import operator
+import aiohttp
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, repeat
+from datetime import date, timedelta
+from typing import NamedTuple
+from config import WEATHER_API_URL
+from cache import normalize_location, inflight_requests, is_complete_day
+from storage import history_store
+from helpers import fetch, request_with_retry
+from ratelimit import PRIORITY_BULK
+from models import WeatherData, Forecast
+
+HISTORY_RANGE = 30  # most days one history.json request returns (dt and end_dt)
+FALLBACK_DAYS = 7  # days fetched one by one if the plan doesn't allow ranges
+
+# weatherapi.com errors meaning the plan doesn't give history ranges, for any location
+RANGE_REFUSALS = {1008, 2009}
+REFUSED = -1  # fetch_range: the range was refused by one of them
+
+_ranges_supported = True
+_single_days = set()  # locations whose ranges came back short, their days are fetched one by one
+
+
+class WindowStats(NamedTuple):
+    days: int  # length of the window
+    count: int  # days of the window with data
+    mean: float  # of the daily average temperature
+    std: float
+    low: float  # lowest daily minimum
+    high: float  # highest daily maximum
+    trend: float  # °C per day, least squares slope of the daily average
+
+    def anomaly(self, value: float) -> float:
+        return value - self.mean
+
+
+class DailySeries:
+    """
+        Daily temperatures of a location, oldest first, possibly with gaps. The running sums are built once,
+        in C by accumulate and map over the arrays; after that every trailing window is summarized
+        in O(log n) instead of a loop over its days.
+        """
+
+    def __init__(self, ordinals: array, avg: array, low: array, high: array):
+        self.ordinals = ordinals
+        x = array('d', map(operator.sub, ordinals, repeat(ordinals[0] if ordinals else 0)))
+        self._sum = array('d', accumulate(avg, initial=0.0))
+        self._sum_sq = array('d', accumulate(map(operator.mul, avg, avg), initial=0.0))
+        self._sum_x = array('d', accumulate(x, initial=0.0))
+        self._sum_xx = array('d', accumulate(map(operator.mul, x, x), initial=0.0))
+        self._sum_xy = array('d', accumulate(map(operator.mul, x, avg), initial=0.0))
+        # lowest minimum and highest maximum of the last k + 1 days
+        self._low = array('d', accumulate(reversed(low), min))
+        self._high = array('d', accumulate(reversed(high), max))
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def window(self, days: int, last: date) -> WindowStats:
+        """
+            Stats of the days days up to last, None if none of them has data.
+            """
+        start = bisect_left(self.ordinals, last.toordinal() - days + 1)
+        n = len(self.ordinals) - start
+        if n <= 0:
+            return None
+
+        def total(sums: array) -> float:
+            return sums[-1] - sums[start]
+
+        mean = total(self._sum) / n
+        std = math.sqrt(max(total(self._sum_sq) / n - mean * mean, 0.0))
+        sum_x = total(self._sum_x)
+        denominator = n * total(self._sum_xx) - sum_x * sum_x
+        trend = (n * total(self._sum_xy) - sum_x * total(self._sum)) / denominator if denominator else 0.0
+        return WindowStats(days, n, mean, std, self._low[n - 1], self._high[n - 1], trend)
+
+    def summarize(self, windows: tuple, last: date) -> dict:
+        return {days: self.window(days, last) for days in windows}
+
+
+async def load_series(api_key: str, city: str, days: int) -> DailySeries:
+    """
+        The last days complete days of city (yesterday included) from history_store. Days not stored yet are
+        fetched first, up to HISTORY_RANGE days per request, so a 90 day window costs 3 requests once
+        and one request a day after that.
+        """
+    location = normalize_location(city)
+    last = date.today() - timedelta(days=1)
+    first = last - timedelta(days=days - 1)
+    stored = history_store.days(location, first, last)
+    missing = [first + timedelta(days=n) for n in range(days) if (first + timedelta(days=n)).isoformat() not in stored]
+    if missing:
+        await backfill(api_key, city, location, missing)
+    return DailySeries(*history_store.series(location, first, last))
+
+
+async def backfill(api_key: str, city: str, location: str, missing: list):
+    if _ranges_supported and location not in _single_days and await backfill_ranges(api_key, city, location, missing):
+        return
+    recent = date.today() - timedelta(days=FALLBACK_DAYS + 1)
+    urls = [f'{WEATHER_API_URL}/history.json?key={api_key}&q={city}&dt={day}&hour=12'
+            for day in missing if day > recent]
+    await asyncio.gather(*(fetch(url, PRIORITY_BULK) for url in urls), return_exceptions=True)
+
+
+async def backfill_ranges(api_key: str, city: str, location: str, missing: list) -> bool:
+    """
+        Fetches the missing days by ranges. False if ranges don't work, then the last days are fetched one by one:
+        for every location once the plan has refused a range, for this location if a range of it came back short.
+        """
+    global _ranges_supported
+    # newest days first: they are the ones every window needs, and the oldest are the first a plan refuses
+    i = len(missing) - 1
+    while i >= 0:
+        end = missing[i]
+        start = max(end - timedelta(days=HISTORY_RANGE - 1), missing[0])
+        url = f'{WEATHER_API_URL}/history.json?key={api_key}&q={city}&dt={start}&end_dt={end}&hour=12'
+        key = ('history_range', location, start.isoformat(), end.isoformat())
+        try:
+            stored = await inflight_requests.do(key, lambda: fetch_range(url, location))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"History of {location} from {start} to {end} not loaded: {e!r}")
+            stored = None
+        if stored == REFUSED:
+            logging.warning(f"history.json refused the range from {start} to {end}, ranges are off")
+            _ranges_supported = False
+            return False
+        if stored is not None and stored < (end - start).days + 1:
+            logging.warning(f"history.json returned {stored} days of {location} from {start} to {end}, "
+                            f"its days are fetched one by one")
+            _single_days.add(location)
+            return False
+        # a range that failed (None) is asked for again by the next request
+        while i >= 0 and missing[i] >= start:
+            i -= 1
+    return True
+
+
+async def fetch_range(url: str, location: str):
+    """
+        Requests a range of past days and stores each of them as a separate day. Returns the number of days returned,
+        REFUSED if the plan doesn't allow the range, None after any other error (temporary, or of this location).
+        """
+    status, data = await request_with_retry(url, 'history', PRIORITY_BULK)
+    if status != 200:
+        logging.warning(f"history.json range: {status} {data}")
+        code = data.get('error', {}).get('code') if isinstance(data, dict) else None
+        return REFUSED if code in RANGE_REFUSALS else None
+    # a day that isn't over at the location yet is not stored, the next request asks for it again
+    days = [forecast_day for forecast_day in data.forecast.forecastday if is_complete_day(forecast_day.date, data)]
+    history_store.put_many(location, [(forecast_day.date, WeatherData(location=data.location,
+                                                                      forecast=Forecast(forecastday=[forecast_day])))
+                                      for forecast_day in days])
+    return len(data.forecast.forecastday)
@@ -0,0 +1,159 @@
+import os
+import time
+import sqlite3
+import logging
+from array import array
+from datetime import date
+from config import HISTORY_DB, SHARED_CACHE_DB
+from models import WeatherData
+
+SCHEMA_VERSION = 1
+
+
+class HistoryStore:
+    """
+        Past days of history.json kept in SQLite, one row per (location, date).
+        The weather of a past day never changes, so once stored a day is never requested from weatherapi.com again,
+        also after a restart of the bot.
+        The daily temperatures are also kept in their own columns (table daily), the statistics read them
+        as arrays without parsing the responses.
+        """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS history ('
+                             'location TEXT NOT NULL, date TEXT NOT NULL, data TEXT NOT NULL, '
+                             'PRIMARY KEY (location, date))')
+            self._migrate()
+            logging.debug(f"History store opened: {self.path}")
+        return self._db
+
+    def _migrate(self):
+        version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if version < 1:
+            with self._db as db:
+                db.execute('CREATE TABLE IF NOT EXISTS daily ('
+                           'location TEXT NOT NULL, date TEXT NOT NULL, '
+                           'avgtemp REAL NOT NULL, mintemp REAL NOT NULL, maxtemp REAL NOT NULL, '
+                           'PRIMARY KEY (location, date))')
+                # days stored before the table existed
+                db.execute("INSERT OR IGNORE INTO daily (location, date, avgtemp, mintemp, maxtemp) "
+                           "SELECT location, date, json_extract(data, '$.forecast.forecastday[0].day.avgtemp_c'), "
+                           "json_extract(data, '$.forecast.forecastday[0].day.mintemp_c'), "
+                           "json_extract(data, '$.forecast.forecastday[0].day.maxtemp_c') FROM history")
+                db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def get(self, location: str, day: str):
+        row = self._connect().execute('SELECT data FROM history WHERE location = ? AND date = ?',
+                                      (location, day)).fetchone()
+        return WeatherData.model_validate_json(row[0]) if row else None
+
+    def put(self, location: str, day: str, data: WeatherData):
+        self.put_many(location, [(day, data)])
+
+    def put_many(self, location: str, days: list):
+        """
+            Stores (day, data) pairs in one transaction.
+            """
+        details = [data.forecast.forecastday[0].day for day, data in days]
+        with self._connect() as db:
+            db.executemany('INSERT OR REPLACE INTO history (location, date, data) VALUES (?, ?, ?)',
+                           [(location, day, data.model_dump_json()) for day, data in days])
+            db.executemany('INSERT OR REPLACE INTO daily (location, date, avgtemp, mintemp, maxtemp) '
+                           'VALUES (?, ?, ?, ?, ?)',
+                           [(location, day, d.avgtemp_c, d.mintemp_c, d.maxtemp_c)
+                            for (day, _), d in zip(days, details)])
+
+    def days(self, location: str, first: date, last: date) -> set:
+        """
+            Dates (iso strings) from first to last that are stored.
+            """
+        rows = self._connect().execute('SELECT date FROM daily WHERE location = ? AND date BETWEEN ? AND ?',
+                                       (location, first.isoformat(), last.isoformat()))
+        return {row[0] for row in rows}
+
+    def series(self, location: str, first: date, last: date) -> tuple:
+        """
+            Stored days from first to last, oldest first, as arrays: (date ordinals, avg, min, max temperature).
+            """
+        rows = self._connect().execute('SELECT date, avgtemp, mintemp, maxtemp FROM daily '
+                                       'WHERE location = ? AND date BETWEEN ? AND ? ORDER BY date',
+                                       (location, first.isoformat(), last.isoformat())).fetchall()
+        days, avg, low, high = zip(*rows) if rows else ((), (), (), ())
+        ordinals = array('l', (date.fromisoformat(day).toordinal() for day in days))
+        return ordinals, array('d', avg), array('d', low), array('d', high)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class SharedCache:
+    """
+        Responses shared by the worker processes (WORKERS > 1) through a SQLite file: a worker that misses
+        its own response_cache looks here before going to weatherapi.com. Values are the response JSON,
+        expiry is wall clock time so that it means the same in every process.
+        """
+
+    def __init__(self, path: str, purge_every: int = 1000):
+        self.path = path
+        self.purge_every = purge_every  # writes between deletions of the expired rows
+        self._writes = 0
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')  # a cache, losing the last writes on a crash is fine
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                             'key TEXT PRIMARY KEY, expires REAL, data TEXT NOT NULL)')
+            logging.debug(f"Shared cache opened: {self.path}")
+        return self._db
+
+    @staticmethod
+    def _key(key: tuple) -> str:
+        return '|'.join(map(str, key))
+
+    def get(self, key: tuple):
+        """
+            (expires, data) of a fresh response, expires is None if it never expires. None if there is none.
+            """
+        return self._connect().execute('SELECT expires, data FROM responses '
+                                       'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                                       (self._key(key), time.time())).fetchone()
+
+    def set(self, key: tuple, data: str, ttl):
+        db = self._connect()
+        db.execute('INSERT OR REPLACE INTO responses (key, expires, data) VALUES (?, ?, ?)',
+                   (self._key(key), None if ttl is None else time.time() + ttl, data))
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            db.execute('DELETE FROM responses WHERE expires < ?', (time.time(),))
+
+    def expires(self, key: tuple):
+        """
+            Wall clock expiry of the response, None if it never expires, 0 if there is no fresh one.
+            """
+        row = self.get(key)
+        return 0 if row is None else row[0]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+history_store = HistoryStore(HISTORY_DB)
+shared_cache = SharedCache(SHARED_CACHE_DB) if SHARED_CACHE_DB else None
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from sender import sender
+from metrics import Counter, command_label
+
+stream_edits = Counter('telegram_stream_edits_total', 'Edits of streamed replies, by command', ('command',))
+
+_tasks = set()  # edit tasks in progress, asyncio keeps only weak references to them
+
+
+class StreamingMessage:
+    """
+        A reply sent at once as a placeholder (title and a row per expected piece of data) and edited
+        as the rows come in, in any order. At most one edit of the message is in the send queue at a time:
+        rows arriving meanwhile go out together in the next edit, so a burst of arrivals costs one edit,
+        not one per row, and the per-chat interval of the sender is respected.
+        """
+
+    def __init__(self, chat_id: int, title: str, rows: int = 0, placeholder: str = '…'):
+        self.chat_id = chat_id
+        self.title = title
+        self.rows = [placeholder] * rows
+        self.final = None  # complete text, replaces title and rows
+        self._sent = self.text()
+        self._message = sender.send_message(chat_id, self._sent)
+        self._task = None
+
+    def text(self) -> str:
+        if self.final is not None:
+            return self.final
+        return '\n'.join([self.title] + self.rows)
+
+    def set(self, index: int, row: str, title: str = None):
+        self.rows[index] = row
+        if title is not None:
+            self.title = title
+        self._schedule()
+
+    def finish(self, messages: list):
+        """
+            Replaces the placeholder with the first of the complete messages, the others are sent after it.
+            Can be called again with a newer text, e.g. a partial answer first and the full one later.
+            """
+        self.final = messages[0] if messages else ''
+        self._schedule()
+        for text in messages[1:]:
+            sender.send_message(self.chat_id, text)
+
+    def _schedule(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._edit())
+            _tasks.add(self._task)
+            self._task.add_done_callback(_tasks.discard)
+
+    async def _edit(self):
+        try:
+            message = await self._message
+        except Exception as e:
+            # the placeholder wasn't sent (the sender has logged why), the complete text goes as a new message
+            if self.final is not None:
+                logging.warning(f"Stream to chat {self.chat_id}: no placeholder to edit ({e}), sending the text")
+                sender.send_message(self.chat_id, self.final)
+            return
+        # the text is taken when the previous edit is done, so rows set meanwhile are sent together
+        while (text := self.text()) != self._sent:
+            self._sent = text
+            stream_edits.inc(command_label())
+            try:
+                await sender.enqueue(self.chat_id, 'edit_message_text', text, self.chat_id, message.message_id)
+            except Exception as e:
+                logging.warning(f"Stream to chat {self.chat_id}: edit failed ({e})")
+                return
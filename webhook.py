@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from aiohttp import web
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+from metrics import Counter, Gauge
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE
+
+
+rejected_updates = Counter('webhook_rejected_total', 'Updates answered with 503 because the queue was full')
+
+
+class WebhookServer:
+    """
+        Receives Telegram updates over http and hands them to a fixed pool of workers running the bot handlers.
+        The queue between them is bounded: when it is full the update is answered with 503 and Telegram
+        delivers it again later, so a burst can't grow memory without limit.
+        """
+
+    def __init__(self, bot: AsyncTeleBot, workers: int = WEBHOOK_WORKERS, queue_size: int = WEBHOOK_QUEUE_SIZE):
+        self.bot = bot
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        Gauge('webhook_queue_size', 'Updates waiting for a webhook worker', func=self.queue.qsize)
+        self._tasks = []
+        self._runner = None
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        update = types.Update.de_json(await request.json())
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logging.warning("Webhook: очередь обновлений заполнена")
+            rejected_updates.inc()
+            return web.Response(status=503)
+        return web.Response()
+
+    async def worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.bot.process_new_updates([update])
+            except Exception as e:
+                logging.error(f"Webhook: ошибка при обработке обновления {update.update_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def start(self, port: int = WEBHOOK_PORT):
+        """
+            port 0 - no http server, the updates are put into queue by the caller (a worker process of shards).
+            """
+        if port:
+            app = web.Application()
+            app.router.add_post(WEBHOOK_PATH, self.handle_update)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, port=port).start()
+            logging.info(f"Webhook server started on port {port}")
+        self._tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        logging.info(f"Update workers started: {self.workers}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def run_webhook(bot: AsyncTeleBot, server=None):
+    """
+        Serves the webhook until cancelled. server - WebhookServer of bot by default, or anything with the same
+        start and stop (shards.Ingester).
+        """
+    server = server or WebhookServer(bot)
+    await server.start()
+    try:
+        if WEBHOOK_URL:
+            await bot.set_webhook(url=f'{WEBHOOK_URL}{WEBHOOK_PATH}', secret_token=WEBHOOK_SECRET or None,
+                                  max_connections=100)
+            logging.info(f"Webhook set: {WEBHOOK_URL}{WEBHOOK_PATH}")
+        else:
+            logging.warning("WEBHOOK_URL is not set, the webhook has to be registered in Telegram by hand")
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()